@@ -28,7 +28,7 @@ from selenium import webdriver
 from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
 from spectrumprivate import file_paths
 
-from spectrum import generator
+from spectrum import generator, polling, prefetch, resources, telemetry
 # so that other processes run by xdist can still print
 # http://stackoverflow.com/questions/27006884/pytest-xdist-without-capturing-output
 # https://github.com/pytest-dev/pytest/issues/680
@@ -39,17 +39,92 @@ def pytest_addoption(parser):
                      action="store",
                      default=None,
                      help="pass an article id to filter only tests related to it")
+    parser.addoption("--prefetch-articles",
+                     action="store",
+                     type=int,
+                     default=0,
+                     help="generate articles for up to this many upcoming tests in the background (default: 0, disabled)")
+
+# the ArticlePrefetcher of this process, if enabled with --prefetch-articles
+PREFETCHER = {'prefetcher': None}
+
+def pytest_sessionstart(session):
+    workers = session.config.getoption('--prefetch-articles')
+    if workers:
+        PREFETCHER['prefetcher'] = prefetch.ArticlePrefetcher(workers)
+
+def pytest_runtest_protocol(item, nextitem):
+    """before running a test, starts generating the articles of the upcoming ones.
+
+    Without xdist the upcoming tests are the next ones in the collected list.
+    With xdist each worker only knows the next test it will run."""
+    prefetcher = PREFETCHER['prefetcher']
+    if prefetcher is None:
+        return
+    if hasattr(item.config, 'workerinput'):
+        upcoming = [nextitem] if nextitem else []
+    else:
+        index = item.session.items.index(item)
+        upcoming = item.session.items[index+1:index+1+item.config.getoption('--prefetch-articles')]
+    prefetcher.prefetch(_template_id(each) for each in upcoming if _template_id(each) is not None)
+
+def _template_id(item):
+    "the template of the article the test generates, when it is a parameter of it"
+    if 'generate_article' not in getattr(item, 'fixturenames', []):
+        return None
+    callspec = getattr(item, 'callspec', None)
+    return callspec.params.get('template_id') if callspec else None
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_xdist_make_scheduler(config, log):
+    "replaces the default `--dist load` of xdist with one sending the longest tests first, see `scheduling`"
+    if config.getoption('dist') != 'load':
+        return None
+    # xdist is only imported when it is running the tests
+    from spectrum import scheduling # pylint: disable=import-outside-toplevel
+    return scheduling.LongestFirstScheduling(config, log)
+
+def pytest_sessionfinish():
+    prefetcher = PREFETCHER['prefetcher']
+    if prefetcher is not None:
+        prefetcher.close()
+        PREFETCHER['prefetcher'] = None
+    resources.RESOURCE_CACHE.close()
 
 @pytest.fixture
 def article_id_filter(request):
     return request.config.getoption('--article-id')
 
+@pytest.fixture(autouse=True)
+def polling_deadline(request):
+    """all the polls of a test share a single time budget:
+    `polling.TEST_DEADLINE` seconds, unless the test is marked with e.g. `@pytest.mark.deadline(1200)`"""
+    marker = request.node.get_closest_marker('deadline')
+    seconds = polling.TEST_DEADLINE
+    if marker:
+        seconds = marker.args[0] if marker.args else marker.kwargs.get('seconds')
+        if not isinstance(seconds, (int, float)) or seconds <= 0:
+            pytest.fail("@pytest.mark.deadline needs a positive number of seconds, e.g. @pytest.mark.deadline(1200), not %s" % marker, pytrace=False)
+    with polling.deadline(seconds):
+        yield
+
+@pytest.fixture
+def polls_filename(tmp_path, monkeypatch):
+    "records the polls of a unit test in a file of its own, rather than in the telemetry of the whole run"
+    filename = str(tmp_path / 'polls.jsonl')
+    monkeypatch.setattr(telemetry, 'POLLS_FILENAME', filename)
+    return filename
+
 @pytest.fixture
 #@pytest.fixture in pytest>=2.10
 def generate_article():
     created_articles = []
     def from_template_id(template_id, article_id=None, **template_variables):
-        article = generator.article_zip(str(template_id), article_id=article_id, template_variables=template_variables)
+        article = None
+        if PREFETCHER['prefetcher'] and article_id is None and not template_variables:
+            article = PREFETCHER['prefetcher'].take(template_id)
+        if article is None:
+            article = generator.article_zip(str(template_id), article_id=article_id, template_variables=template_variables)
         created_articles.append(article)
         return article
     yield from_template_id
@@ -155,6 +230,17 @@ def _clean_all(created_articles):
     for article in created_articles:
         article.clean()
 
+def pytest_terminal_summary(terminalreporter, config):
+    # only the xdist controller, not its workers, reports
+    if hasattr(config, 'workerinput'):
+        return
+    polls = telemetry.read_polls()
+    if not polls:
+        return
+    terminalreporter.section("polls")
+    for line in telemetry.summary_lines(polls):
+        terminalreporter.write_line(line)
+
 # FUTURE: try to customize report
 #def pytest_runtest_makereport(item):
 #    pass
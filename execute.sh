@@ -2,6 +2,7 @@
 set -e
 # ARGUMENTS
 # --article-id=15600  optional, if you want to filter a particular article
+# --prefetch-articles=2  optional, to generate the articles of upcoming tests in the background
 
 # cd to the project's directory so that the script can be run from anywhere
 DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
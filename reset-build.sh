@@ -3,6 +3,10 @@ set -e
 
 # clean up possible build results to avoid confusion 
 # on further builds picking them up
-rm -f build/junit.xml
+# the test durations of the last run are kept to schedule the longest tests first
+if [ -f build/junit.xml ]; then
+    mv build/junit.xml build/junit.xml.previous
+fi
 rm -f build/test.log
+rm -f build/polls.jsonl
 rm -f build/screenshots/*.png
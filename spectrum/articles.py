@@ -3,7 +3,8 @@ from spectrum import checks
 from spectrum import input
 
 def ingest(article):
-    input.PRODUCTION_BUCKET.upload(article.filename(), id=article.id())
+    with article.open() as zip_file:
+        input.PRODUCTION_BUCKET.upload_fileobj(zip_file, article.basename(), id=article.id())
 
 def wait_for_publishable(article, run_after):
     article_on_dashboard = checks.DASHBOARD.ready_to_publish(id=article.id(), version=article.version(), run_after=run_after)
@@ -11,11 +12,11 @@ def wait_for_publishable(article, run_after):
     runs = current_version['runs']
     last_run_number = max(int(i) for i in runs.keys())
     run = runs[str(last_run_number)]['run-id']
-    for each in article.figure_names():
-        checks.IMAGES_PUBLISHED_CDN_BUCKET.of(id=article.id(), figure_name=each, version=article.version())
-    checks.XML_PUBLISHED_CDN_BUCKET.of(id=article.id(), version=article.version())
+    published_files = [checks.IMAGES_PUBLISHED_CDN_BUCKET.criteria(id=article.id(), figure_name=each, version=article.version()) for each in article.figure_names()]
+    published_files.append(checks.XML_PUBLISHED_CDN_BUCKET.criteria(id=article.id(), version=article.version()))
     if article.has_pdf():
-        checks.PDF_PUBLISHED_CDN_BUCKET.of(id=article.id(), version=article.version())
+        published_files.append(checks.PDF_PUBLISHED_CDN_BUCKET.criteria(id=article.id(), version=article.version()))
+    checks.PUBLISHED_CDN_BUCKET.all_of(published_files, id=article.id())
     checks.API_SUPER_USER.article(id=article.id(), version=article.version())
     return run
 
@@ -23,4 +24,5 @@ def publish(article, run):
     input.DASHBOARD.publish(id=article.id(), version=article.version(), run=run)
 
 def feed_silent_correction(article):
-    input.SILENT_CORRECTION_BUCKET.upload(article.filename(), id=article.id())
+    with article.open() as zip_file:
+        input.SILENT_CORRECTION_BUCKET.upload_fileobj(zip_file, article.basename(), id=article.id())
@@ -1,51 +1,73 @@
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import datetime
+import os
 import re
+import threading
+import time
 
-import boto3
 from spectrum.config import SETTINGS
 from spectrum import logger
 
 LOGGER = logger.logger(__name__)
-S3 = boto3.resource(
-    's3',
-    aws_access_key_id=SETTINGS['aws_access_key_id'],
-    aws_secret_access_key=SETTINGS['aws_secret_access_key'],
-    region_name=SETTINGS['region_name']
-)
-SWF = boto3.client(
-    'swf',
-    aws_access_key_id=SETTINGS['aws_access_key_id'],
-    aws_secret_access_key=SETTINGS['aws_secret_access_key'],
-    region_name=SETTINGS['region_name']
-)
-SQS = boto3.client(
-    'sqs',
-    aws_access_key_id=SETTINGS['aws_access_key_id'],
-    aws_secret_access_key=SETTINGS['aws_secret_access_key'],
-    region_name=SETTINGS['region_name']
-)
 
-def clean():
-    open_workflow_executions = SWF.list_open_workflow_executions(
-        domain='Publish.end2end',
-        startTimeFilter={
-            'oldestDate': datetime.datetime.now() - datetime.timedelta(days=1),
-            'latestDate': datetime.datetime.now()
-        }
-    )
-    assert 'executionInfos' in open_workflow_executions
-    for workflow in open_workflow_executions['executionInfos']:
-        SWF.terminate_workflow_execution(
-            domain='Publish.end2end',
-            workflowId=workflow['execution']['workflowId'],
-            runId=workflow['execution']['runId'],
-            reason='end2end testing environment cleanup'
-        )
-        LOGGER.info(
-            "Terminated workflow: workflowId=%s runId=%s",
-            workflow['execution']['workflowId'],
-            workflow['execution']['runId']
+SWF_DOMAIN = 'Publish.end2end'
+# how far back to look for open workflow executions to terminate
+CLEAN_WORKFLOWS_WINDOW = int(os.environ.get('SPECTRUM_CLEAN_WORKFLOWS_WINDOW', 24)) # hours
+# how many executions to terminate in parallel, and how many per second at most
+TERMINATE_CONCURRENCY = int(os.environ.get('SPECTRUM_TERMINATE_CONCURRENCY', 4))
+TERMINATE_RATE = float(os.environ.get('SPECTRUM_TERMINATE_RATE', 10))
+# uploads larger than a part are split in parts uploaded in parallel
+UPLOAD_PART_SIZE = int(os.environ.get('SPECTRUM_UPLOAD_PART_SIZE', 8 * 1024 * 1024))
+UPLOAD_CONCURRENCY = int(os.environ.get('SPECTRUM_UPLOAD_CONCURRENCY', 4))
+# the maximum number of keys accepted by a single DeleteObjects call
+DELETE_BATCH_SIZE = 1000
+# how many DeleteObjects calls to make in parallel
+DELETE_CONCURRENCY = int(os.environ.get('SPECTRUM_CLEAN_CONCURRENCY', 8))
+
+class LazyClient:
+    def __init__(self, factory):
+        """Stands in for the boto3 client or resource returned by factory, creating it on first use.
+
+        Creating clients loads service models from disk and takes a noticeable fraction of a second each,
+        which every process importing this module (every pytest worker, every collection) would otherwise pay."""
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._client = None
+
+    def __getattr__(self, name):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return getattr(self._client, name)
+
+def _boto3(factory_name, service_name):
+    def _create():
+        import boto3 # pylint: disable=import-outside-toplevel
+        return getattr(boto3, factory_name)(
+            service_name,
+            aws_access_key_id=SETTINGS['aws_access_key_id'],
+            aws_secret_access_key=SETTINGS['aws_secret_access_key'],
+            region_name=SETTINGS['region_name']
         )
+    return LazyClient(_create)
+
+S3 = _boto3('resource', 's3')
+SWF = _boto3('client', 'swf')
+SQS = _boto3('client', 'sqs')
+
+def transfer_config():
+    "settings for the multipart uploads made by upload_file and upload_fileobj"
+    from boto3.s3.transfer import TransferConfig # pylint: disable=import-outside-toplevel
+    return TransferConfig(
+        multipart_threshold=UPLOAD_PART_SIZE,
+        multipart_chunksize=UPLOAD_PART_SIZE,
+        max_concurrency=UPLOAD_CONCURRENCY
+    )
+
+def clean():
+    clean_workflows()
 
     all_buckets = S3.meta.client.list_buckets()['Buckets']
     buckets_to_clean = [b['Name'] for b in all_buckets if re.match(r".*end2end.*", b['Name'])]
@@ -53,25 +75,159 @@ def clean():
     for bucket_name in buckets_to_clean:
         clean_bucket(bucket_name)
 
+def clean_workflows(domain=SWF_DOMAIN, window_hours=None):
+    """Terminates every open workflow execution in domain started in the last window_hours.
+
+    Executions are listed a page at a time and terminated by up to TERMINATE_CONCURRENCY threads,
+    no more than TERMINATE_RATE per second overall to stay clear of the SWF throttling limits.
+    Returns how many executions were terminated, failed to be terminated, or were skipped because they had already closed."""
+    window_hours = window_hours if window_hours is not None else CLEAN_WORKFLOWS_WINDOW
+    rate_limiter = RateLimiter(TERMINATE_RATE)
+    summary = {'terminated': 0, 'failed': 0, 'skipped': 0}
+    with ThreadPoolExecutor(max_workers=TERMINATE_CONCURRENCY) as executor:
+        outcomes = executor.map(
+            lambda execution: _terminate(domain, execution, rate_limiter),
+            _open_workflow_executions(domain, window_hours)
+        )
+        for outcome in outcomes:
+            summary[outcome] = summary[outcome] + 1
+    LOGGER.info(
+        "Open workflow executions in %s started in the last %s hours: %d terminated, %d failed, %d skipped",
+        domain,
+        window_hours,
+        summary['terminated'],
+        summary['failed'],
+        summary['skipped']
+    )
+    return summary
+
+def _open_workflow_executions(domain, window_hours):
+    now = datetime.datetime.now()
+    arguments = {
+        'domain': domain,
+        'startTimeFilter': {
+            'oldestDate': now - datetime.timedelta(hours=window_hours),
+            'latestDate': now
+        }
+    }
+    while True:
+        open_workflow_executions = SWF.list_open_workflow_executions(**arguments)
+        assert 'executionInfos' in open_workflow_executions
+        for workflow in open_workflow_executions['executionInfos']:
+            yield workflow['execution']
+        if not open_workflow_executions.get('nextPageToken'):
+            return
+        arguments['nextPageToken'] = open_workflow_executions['nextPageToken']
+
+def _terminate(domain, execution, rate_limiter):
+    from botocore.exceptions import ClientError # pylint: disable=import-outside-toplevel
+    rate_limiter.acquire()
+    try:
+        SWF.terminate_workflow_execution(
+            domain=domain,
+            workflowId=execution['workflowId'],
+            runId=execution['runId'],
+            reason='end2end testing environment cleanup'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'UnknownResourceFault':
+            LOGGER.info("Workflow already closed: workflowId=%s runId=%s", execution['workflowId'], execution['runId'])
+            return 'skipped'
+        LOGGER.error("Could not terminate workflow: workflowId=%s runId=%s: %s", execution['workflowId'], execution['runId'], e)
+        return 'failed'
+    LOGGER.info(
+        "Terminated workflow: workflowId=%s runId=%s",
+        execution['workflowId'],
+        execution['runId']
+    )
+    return 'terminated'
+
+class RateLimiter:
+    def __init__(self, rate):
+        "Lets callers through at most `rate` times per second, across threads"
+        self._interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait_for = self._next - now
+            self._next = max(now, self._next) + self._interval
+        if wait_for > 0:
+            time.sleep(wait_for)
+
 def clean_bucket(bucket_name, prefix=None):
+    """Deletes every object in bucket_name, or only those under prefix.
+
+    Keys are listed a page at a time and deleted in batches of DELETE_BATCH_SIZE by up to DELETE_CONCURRENCY threads,
+    so that memory use doesn't grow with the size of the bucket.
+    Returns the number of deleted objects and the keys that could not be deleted, by error code."""
     msg = "Cleaning bucket %s" % bucket_name
     if prefix:
         msg = msg + " by prefix %s" % prefix
-    LOGGER.debug(msg, extra={'id': id})
-    bucket = S3.Bucket(bucket_name)
-    bucket.load()
-    all_objects = bucket.objects.all()
+    LOGGER.debug(msg)
+    progress = {'deleted': 0, 'errors': defaultdict(list), 'started': time.monotonic()}
+    with ThreadPoolExecutor(max_workers=DELETE_CONCURRENCY) as executor:
+        pending = set()
+        for batch in _key_batches(bucket_name, prefix, DELETE_BATCH_SIZE):
+            # at most a couple of batches waiting for each thread, rather than the whole listing
+            if len(pending) >= 2 * DELETE_CONCURRENCY:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _record_deletions(bucket_name, done, progress)
+            pending.add(executor.submit(_delete_batch, bucket_name, batch))
+        _record_deletions(bucket_name, wait(pending).done, progress)
+    elapsed = time.monotonic() - progress['started']
+    LOGGER.info(
+        "Deleted %d objects from bucket %s in %.1f seconds (%.0f objects/s)",
+        progress['deleted'],
+        bucket_name,
+        elapsed,
+        progress['deleted'] / elapsed if elapsed else 0
+    )
+    for code, keys in progress['errors'].items():
+        LOGGER.error("Could not delete %d objects from bucket %s (%s), e.g. %s", len(keys), bucket_name, code, keys[0:5])
+    return progress['deleted'], dict(progress['errors'])
+
+def _key_batches(bucket_name, prefix, batch_size):
+    arguments = {'Bucket': bucket_name}
     if prefix:
-        all_objects = all_objects.filter(Prefix=prefix)
-    keys = [file.key for file in all_objects]
-    batch_size = 100
-    batches = [keys[lower:lower+batch_size] for lower in range(0, len(keys), batch_size)]
-    for batch in batches:
-        bucket.delete_objects(Delete={
-            'Objects': [{'Key': key} for key in batch]
-        })
-        LOGGER.info(
-            "Deleted from bucket %s the keys %s",
-            bucket_name,
-            batch
+        arguments['Prefix'] = prefix
+    batch = []
+    for page in S3.meta.client.get_paginator('list_objects_v2').paginate(**arguments):
+        for each in page.get('Contents', []):
+            batch.append(each['Key'])
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def _delete_batch(bucket_name, batch):
+    "deletes a batch of keys, returning how many were attempted and the (key, error code) pairs of those that could not be deleted"
+    from botocore.exceptions import ClientError # pylint: disable=import-outside-toplevel
+    try:
+        response = S3.meta.client.delete_objects(
+            Bucket=bucket_name,
+            Delete={
+                'Objects': [{'Key': key} for key in batch],
+                'Quiet': True,
+            }
         )
+    except ClientError as e:
+        return len(batch), [(key, e.response['Error']['Code']) for key in batch]
+    return len(batch), [(error['Key'], error['Code']) for error in response.get('Errors', [])]
+
+def _record_deletions(bucket_name, done, progress):
+    for future in done:
+        attempted, errors = future.result()
+        progress['deleted'] = progress['deleted'] + attempted - len(errors)
+        for key, code in errors:
+            progress['errors'][code].append(key)
+    elapsed = time.monotonic() - progress['started']
+    LOGGER.info(
+        "Deleted %d objects from bucket %s so far (%.0f objects/s)",
+        progress['deleted'],
+        bucket_name,
+        progress['deleted'] / elapsed if elapsed else 0
+    )
@@ -2,96 +2,303 @@
 Contains anything from HTTP(S) calls to REST JSON APIs to S3 checks over the presence or recent modification of files."""
 
 from concurrent.futures import wait
-from datetime import datetime
+from datetime import datetime, timedelta
 from pprint import pformat
 import io
 import re
 import ssl
+import time
 import zipfile
-from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
-import requests
 from requests.exceptions import ConnectionError
 from requests_futures.sessions import FuturesSession
-from spectrum import aws, config, logger, polling, retries
+from spectrum import aws, config, http_client, logger, polling, retries
+from spectrum.coalescing import SingleFlight
+from spectrum.listings import LISTING_CACHE
+from spectrum.resources import RESOURCE_CACHE
 from spectrum.config import SETTINGS
 from spectrum.exceptions import UnrecoverableError, assert_status_code
 from spectrum.mailcatcher import MailcatcherCheck
+from spectrum.notifications import BucketNotifications
 
 
 GLOBAL_TIMEOUT = polling.GLOBAL_TIMEOUT
 HTTP_TIMEOUT = 30 # seconds
+BUCKET_LISTING_FALLBACK_INTERVAL = 10 # seconds
 LOGGER = logger.logger(__name__)
 
-class BucketFileCheck:
-    def __init__(self, s3, bucket_name, key, prefix=None):
+class BucketFileCheck: # pylint: disable=too-many-instance-attributes
+    def __init__(self, s3, bucket_name, key, prefix=None, polling_profile=polling.DEFAULT, notifications=None, start_after=None):
         """Polls for the existence of a file in bucket_name.
 
         key is a pattern to be filled with the args passed to of().
-        prefix is a API call filter to be used to reduce the number of objects to scan.
+        A key without regex metacharacters, e.g. with `\\.` rather than `.`, is looked up directly with a HEAD request rather than listed:
+        it then has to be the whole key, rather than its start. Listing is used instead if HEAD is forbidden.
+        prefix is a API call filter to be used to reduce the number of objects to scan,
+        narrowed further to the literal start of key where possible.
+        polling_profile decides how often to list the bucket, and for how long.
+        notifications is an optional BucketNotifications: when given, objects announced on its queue are found
+        without listing the bucket, which is still listed every BUCKET_LISTING_FALLBACK_INTERVAL seconds in case one was missed.
+        start_after is an optional pattern filled with the args passed to of() and `last_modified_after`,
+        only used when the latter is given: the listing starts after this key, skipping older objects.
         """
         self._s3 = s3
         self._bucket_name = bucket_name
         self._key = key
         self._prefix = prefix
+        self._polling_profile = polling_profile
+        self._notifications = notifications
+        self._start_after = start_after
+        self._head_forbidden = False
 
     def of(self, last_modified_after=None, **kwargs):
-        criteria = self._key.format(**kwargs)
+        criteria = self.criteria(**kwargs)
         last_modified_suffix = (" and being last_modified after %s" % last_modified_after) if last_modified_after else ""
+        last_listing = {'time': None}
+        lookup = {
+            'pattern': re.compile(criteria),
+            'literal_key': _literal_key(criteria),
+            'prefix': _narrowed_prefix(self._prefix.format(**kwargs) if self._prefix else None, criteria),
+            'start_after': None,
+        }
+        if self._start_after and last_modified_after:
+            # a day earlier, in case the keys are dated in a different timezone
+            lookup['start_after'] = self._start_after.format(last_modified_after=last_modified_after - timedelta(days=1), **kwargs)
         return _poll(
-            lambda: self._is_present(criteria, last_modified_after, **kwargs),
+            lambda: self._is_present(lookup, last_modified_after, last_listing, **kwargs),
             "object matching criteria %s in bucket %s"+last_modified_suffix,
-            criteria, self._bucket_name
+            criteria, self._bucket_name,
+            profile=self._polling_profile
         )
 
-    def _is_present(self, criteria, last_modified_after, **kwargs):
-        try:
-            id = kwargs.get('id')
-            bucket = self._s3.Bucket(self._bucket_name)
-            # TODO: necessary?
-            bucket.load()
-            all_objects = bucket.objects.all()
-            if self._prefix:
-                prefix = self._prefix.format(**kwargs)
-                all_objects = all_objects.filter(Prefix=prefix)
+    def all_of(self, all_criteria, last_modified_after=None, **kwargs):
+        """Polls for the existence of an object matching each of all_criteria,
+        listing the prefix filled with kwargs once per attempt rather than once per criteria.
+
+        all_criteria are patterns as returned by `criteria()`, possibly of other checks on the same bucket.
+        Returns the list of matching keys, in the same order as all_criteria."""
+        found = {}
+        last_listing = {'time': None}
+        patterns = {criteria: re.compile(criteria) for criteria in all_criteria}
+        last_modified_suffix = (" and being last_modified after %s" % last_modified_after) if last_modified_after else ""
+        return _poll(
+            lambda: self._are_all_present(patterns, found, last_modified_after, last_listing, **kwargs),
+            "objects matching all of %s in bucket %s" + last_modified_suffix,
+            all_criteria, self._bucket_name,
+            profile=self._polling_profile
+        )
+
+    def criteria(self, **kwargs):
+        "the pattern of the key this check waits for, given the args passed to of()"
+        return self._key.format(**kwargs)
+
+    def _are_all_present(self, patterns, found, last_modified_after, last_listing, **kwargs):
+        id = kwargs.get('id')
+        if self._notifications:
+            for criteria, pattern in patterns.items():
+                if criteria in found:
+                    continue
+                announced = self._notifications.find(self._bucket_name, pattern, last_modified_after)
+                if announced:
+                    LOGGER.info("Found announcement of %s in bucket %s", announced[0], self._bucket_name, extra={'id': id})
+                    found[criteria] = announced[0]
+        missing = [each for each in patterns if each not in found]
+        if missing and self._listing_due(last_listing):
+            try:
+                prefix = self._prefix.format(**kwargs) if self._prefix else None
+                for file in self._list(prefix, not_before=last_modified_after):
+                    if last_modified_after and file['LastModified'].strftime('%s') <= last_modified_after.strftime('%s'):
+                        continue
+                    for criteria in missing:
+                        if criteria not in found and patterns[criteria].match(file['Key']):
+                            LOGGER.info(
+                                "Found %s in bucket %s (last modified: %s)",
+                                file['Key'],
+                                self._bucket_name,
+                                file['LastModified'],
+                                extra={'id': id}
+                            )
+                            found[criteria] = file['Key']
+            except ssl.SSLError as e:
+                _log_connection_error(e)
+            missing = [each for each in patterns if each not in found]
+        if missing:
+            return (False, {'missing': missing})
+        return [found[each] for each in patterns]
+
+    def _listing_due(self, last_listing):
+        "without notifications every attempt lists the bucket, with them only every BUCKET_LISTING_FALLBACK_INTERVAL"
+        if not self._notifications:
+            return True
+        if last_listing['time'] and time.time() - last_listing['time'] < BUCKET_LISTING_FALLBACK_INTERVAL:
+            return False
+        last_listing['time'] = time.time()
+        return True
+
+    def _is_present(self, lookup, last_modified_after, last_listing, **kwargs):
+        id = kwargs.get('id')
+        pattern = lookup['pattern']
+        if self._notifications:
+            announced = self._notifications.find(self._bucket_name, pattern, last_modified_after)
+            if announced:
+                key, last_modified = announced
                 LOGGER.debug(
-                    "Filtering by prefix %s",
-                    prefix,
+                    "Found announcement of %s in bucket %s",
+                    key,
+                    self._bucket_name,
                     extra={'id': id}
                 )
-            for file in all_objects:
-                match = re.match(criteria, file.key)
+                return self._found(pattern.match(key), key, last_modified, id)
+        if not self._listing_due(last_listing):
+            return False
+        try:
+            candidates = self._head(lookup['literal_key']) if lookup['literal_key'] else None
+            if candidates is None:
+                if lookup['prefix']:
+                    LOGGER.debug(
+                        "Filtering by prefix %s",
+                        lookup['prefix'],
+                        extra={'id': id}
+                    )
+                candidates = self._list(lookup['prefix'], lookup['start_after'], not_before=last_modified_after)
+            for file in candidates:
+                match = pattern.match(file['Key'])
                 if match:
                     LOGGER.debug(
                         "Found candidate %s in bucket %s (last modified: %s)",
-                        file.key,
+                        file['Key'],
                         self._bucket_name,
-                        file.last_modified,
+                        file['LastModified'],
                         extra={'id': id}
                     )
                     if last_modified_after:
-                        if file.last_modified.strftime('%s') <= last_modified_after.strftime('%s'):
+                        if file['LastModified'].strftime('%s') <= last_modified_after.strftime('%s'):
                             continue
-                    LOGGER.info(
-                        "Found %s in bucket %s (last modified: %s)",
-                        file.key,
-                        self._bucket_name,
-                        file.last_modified,
-                        extra={'id': id}
-                    )
-                    if match.groups():
-                        LOGGER.info(
-                            "Found groups %s in matching the file name %s",
-                            match.groups(),
-                            file.key,
-                            extra={'id': id}
-                        )
-                        return (match.groups(), {'key': file.key})
-                    return True
+                    return self._found(match, file['Key'], file['LastModified'], id)
         except ssl.SSLError as e:
             _log_connection_error(e)
         return False
 
+    def _head(self, key):
+        """the object at exactly this key, as a listing of zero or one objects.
+
+        None if HEAD is forbidden: it requires s3:GetObject rather than the s3:ListBucket of listings"""
+        if self._head_forbidden:
+            return None
+        def _head_object():
+            from botocore.exceptions import ClientError # pylint: disable=import-outside-toplevel
+            try:
+                response = self._s3.meta.client.head_object(Bucket=self._bucket_name, Key=key)
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                if code in ('404', 'NoSuchKey', 'NotFound'):
+                    return []
+                if code in ('403', 'AccessDenied', 'Forbidden'):
+                    LOGGER.warning("Cannot HEAD %s in bucket %s (%s), listing it instead from now on", key, self._bucket_name, code)
+                    self._head_forbidden = True
+                    return None
+                raise
+            return [{'Key': key, 'LastModified': response['LastModified']}]
+        return IN_FLIGHT.call(('HEAD', self._bucket_name, key), _head_object)
+
+    def _list(self, prefix, start_after=None, not_before=None):
+        """lists objects in the bucket, sharing the listing with any identical one in flight
+        or, for a few seconds, with any identical one started after not_before"""
+        key = (self._bucket_name, prefix, start_after)
+        cached = LISTING_CACHE.get(key, not_before)
+        if cached is not None:
+            return cached
+        def _list_objects():
+            started_at = time.time()
+            arguments = {'Bucket': self._bucket_name}
+            if prefix:
+                arguments['Prefix'] = prefix
+            if start_after:
+                arguments['StartAfter'] = start_after
+            objects = []
+            for page in self._s3.meta.client.get_paginator('list_objects_v2').paginate(**arguments):
+                objects.extend(page.get('Contents', []))
+            LISTING_CACHE.put(key, started_at, objects)
+            return objects
+        return IN_FLIGHT.call(('LIST',) + key, _list_objects)
+
+    def _found(self, match, key, last_modified, id):
+        LOGGER.info(
+            "Found %s in bucket %s (last modified: %s)",
+            key,
+            self._bucket_name,
+            last_modified,
+            extra={'id': id}
+        )
+        if match.groups():
+            LOGGER.info(
+                "Found groups %s in matching the file name %s",
+                match.groups(),
+                key,
+                extra={'id': id}
+            )
+            return (match.groups(), {'key': key})
+        return True
+
+# characters with a special meaning in a key pattern, apart from `.`
+# which in practice is always meant literally, e.g. `elife-{id}-v{version}.xml`
+REGEX_METACHARACTERS = set('\\^$*+?{}[]|()')
+
+def _literal_key(criteria):
+    """the key matched by criteria if it is a plain key rather than a pattern, otherwise None.
+
+    Escaped characters such as `\\.` are literal, while any other regex metacharacter, `.` included, makes criteria a pattern"""
+    literal_key = ''
+    escaped = False
+    for character in criteria:
+        if escaped:
+            # e.g. \d
+            if character.isalnum():
+                return None
+            literal_key = literal_key + character
+            escaped = False
+        elif character == '\\':
+            escaped = True
+        elif character in REGEX_METACHARACTERS or character == '.':
+            return None
+        else:
+            literal_key = literal_key + character
+    if escaped:
+        return None
+    return literal_key
+
+def _narrowed_prefix(prefix, criteria):
+    "the longest prefix shared by all keys matching criteria, if it is more specific than prefix"
+    if _has_top_level_alternation(criteria):
+        return prefix
+    literal_start = ''
+    for index, character in enumerate(criteria):
+        if character in REGEX_METACHARACTERS or character == '.':
+            # a quantifier applies to the previous character, which then isn't certain to be there
+            if character in '*?{' and literal_start:
+                literal_start = literal_start[:-1]
+            break
+        literal_start = criteria[:index+1]
+    if prefix and not literal_start.startswith(prefix):
+        return prefix
+    return literal_start or prefix
+
+def _has_top_level_alternation(criteria):
+    depth = 0
+    escaped = False
+    for character in criteria:
+        if escaped:
+            escaped = False
+        elif character == '\\':
+            escaped = True
+        elif character == '(':
+            depth = depth + 1
+        elif character == ')':
+            depth = depth - 1
+        elif character == '|' and depth == 0:
+            return True
+    return False
+
 class DashboardArticleCheck:
     def __init__(self, host, user, password):
         self._host = host
@@ -123,7 +330,8 @@ class DashboardArticleCheck:
         return _poll(
             lambda: self._is_last_event_error(id, version, run),
             "having the last event as an error on the article version %s on dashboard: %s/api/article/%s",
-            version, self._host, id
+            version, self._host, id,
+            profile=polling.DEFAULT
         )
 
     def _wait_for_status(self, id, version, status, run=None, run_after=None, run_contains_events=None):
@@ -135,13 +343,14 @@ class DashboardArticleCheck:
             run,
             run_after,
             self._host,
-            id
+            id,
+            profile=polling.DEFAULT
         )
 
     def _is_present(self, id, version, status, run=None, run_after=None, run_contains_events=None):
         url = self._article_api(id)
         try:
-            response = requests.get(url, auth=(self._user, self._password))
+            response = _coalesced_get(url, auth=(self._user, self._password))
             if response.status_code != 200:
                 return False, "Response code: %s" % response.status_code
             if response.status_code >= 500:
@@ -233,7 +442,7 @@ class DashboardArticleCheck:
         url = self._article_api(id)
         version_key = str(version)
         try:
-            response = requests.get(url, auth=(self._user, self._password))
+            response = _coalesced_get(url, auth=(self._user, self._password))
             if response.status_code >= 500:
                 raise UnrecoverableError(response)
             article = response.json()
@@ -271,14 +480,15 @@ class LaxArticleCheck:
         return _poll(
             lambda: self._is_present(id, version),
             "article version %s in lax: %s/api/v2/articles/%s/versions/%s",
-            version, self._host, id, version
+            version, self._host, id, version,
+            profile=polling.FAST
         )
 
     def _is_present(self, id, version):
         template = "%s/api/v2/articles/%s/versions/%s"
         url = template % (self._host, id, version)
         try:
-            response = requests.get(url)
+            response = _coalesced_get(url)
             if response.status_code != 200:
                 return False
             if response.status_code >= 500:
@@ -347,14 +557,17 @@ class ApiCheck:
 
     def bioprotocol(self, id):
         url = self._host + '/bioprotocol/article/%s' % id
-        response = requests.get(url, headers=self._base_headers())
+        response = http_client.get(url, headers=self._base_headers())
         LOGGER.info("Found %s: %s", url, response.status_code)
         return self._ensure_sane_response(response, url)
 
     def wait_digest(self, id, item_check=None):
         latest_url = "%s/digests/%s" % (self._host, id)
+        conditional_requests = ConditionalRequests()
         def _is_ready():
-            response = requests.get(latest_url, headers=self._base_headers())
+            response = conditional_requests.get(latest_url, headers=self._base_headers())
+            if response is None:
+                return False
             if response.status_code == 404:
                 LOGGER.debug("%s: 404", latest_url)
                 return False
@@ -370,18 +583,19 @@ class ApiCheck:
         return _poll(
             _is_ready,
             "%s",
-            latest_url
+            latest_url,
+            profile=polling.FAST
         )
 
     def _list_api(self, path, entity):
         url = "%s%s" % (self._host, path)
-        response = requests.get(url, headers=self._base_headers({'Accept': 'application/vnd.elife.%s-list+json; version=1' % entity}))
+        response = http_client.get(url, headers=self._base_headers({'Accept': 'application/vnd.elife.%s-list+json; version=1' % entity}))
         LOGGER.info("Found %s: %s", url, response.status_code)
         return self._ensure_sane_response(response, url)
 
     def _item_api(self, path, entity):
         url = "%s%s" % (self._host, path)
-        response = requests.get(url, headers=self._base_headers({'Accept': 'application/vnd.elife.%s+json; version=1' % entity}))
+        response = http_client.get(url, headers=self._base_headers({'Accept': 'application/vnd.elife.%s+json; version=1' % entity}))
         LOGGER.info("Found %s: %s", url, response.status_code)
         return self._ensure_sane_response(response, url)
 
@@ -389,14 +603,14 @@ class ApiCheck:
         versioned_url = "%s/articles/%s/versions/%s" % (self._host, id, version)
         # we should pass 'Accept': 'application/vnd.elife.article-poa+json,application/vnd.elife.article-vor+json'
         # if that works... requests does not support a multidict, it seems
-        response = requests.get(versioned_url, headers=self._base_headers())
+        response = http_client.get(versioned_url, headers=self._base_headers())
         body = self._ensure_sane_response(response, versioned_url)
         assert body['version'] == version, \
             ("Version in body %s not consistent with requested version %s" % (body['version'], version))
         LOGGER.info("Found article version %s on api: %s", body['version'], versioned_url, extra={'id': id})
 
         latest_url = "%s/articles/%s" % (self._host, id)
-        response = requests.get(latest_url, headers=self._base_headers())
+        response = http_client.get(latest_url, headers=self._base_headers())
         body = self._ensure_sane_response(response, latest_url)
         assert body['version'] == version, \
             ("We were expecting /article/%s to be at version %s now" % (id, version))
@@ -406,8 +620,11 @@ class ApiCheck:
     def wait_article(self, id, item_check=None, **constraints):
         "Article must be immediately present with this version, but will poll until the constraints (fields with certain values) are satisfied"
         latest_url = "%s/articles/%s" % (self._host, id)
+        conditional_requests = ConditionalRequests()
         def _is_ready():
-            response = requests.get(latest_url, headers=self._base_headers())
+            response = conditional_requests.get(latest_url, headers=self._base_headers())
+            if response is None:
+                return False
             if response.status_code == 404:
                 LOGGER.debug("%s: 404", latest_url)
                 return False
@@ -430,19 +647,20 @@ class ApiCheck:
         return _poll(
             _is_ready,
             "%s to satisfy constraints %s",
-            latest_url, constraints
+            latest_url, constraints,
+            profile=polling.FAST
         )
 
     def related_articles(self, id):
         url = "%s/articles/%s/related" % (self._host, id)
-        response = requests.get(url, headers=self._base_headers())
+        response = http_client.get(url, headers=self._base_headers())
         assert response.status_code == 200, "%s is not 200 but %s: %s" % (url, response.status_code, response.text)
         LOGGER.info("Found related articles of %s on api: %s", id, url, extra={'id': id})
         return response.json()
 
     def search(self, for_input):
         url = "%s/search?for=%s" % (self._host, for_input)
-        response = requests.get(url, headers=self._base_headers())
+        response = http_client.get(url, headers=self._base_headers())
         return self._ensure_sane_response(response, url)
 
     def wait_search(self, word, item_check=None):
@@ -450,8 +668,11 @@ class ApiCheck:
 
         item_check can be used to verify the only result satisfies a condition"""
         search_url = "%s/search?for=%s" % (self._host, word)
+        conditional_requests = ConditionalRequests()
         def _is_ready():
-            response = retries.persistently_get(search_url, headers=self._base_headers())
+            response = conditional_requests.get(search_url, getter=retries.persistently_get, headers=self._base_headers())
+            if response is None:
+                return False
             body = self._ensure_sane_response(response, search_url)
             LOGGER.debug("Search result: %s", body)
             if len(body['items']) == 0:
@@ -469,7 +690,8 @@ class ApiCheck:
         return _poll(
             _is_ready,
             "%s returning at least 1 result",
-            search_url
+            search_url,
+            profile=polling.FAST
         )
 
     def item_check_image(self, uri=None):
@@ -504,7 +726,7 @@ class ApiCheck:
         "Returns as soon as there is one result"
         recommendations_url = "%s/recommendations/article/%s" % (self._host, id)
         def _is_ready():
-            response = requests.get(recommendations_url, headers=self._base_headers({'Accept': 'application/vnd.elife.recommendations+json; version=2'}))
+            response = _coalesced_get(recommendations_url, headers=self._base_headers({'Accept': 'application/vnd.elife.recommendations+json; version=2'}))
             body = self._ensure_sane_response(response, recommendations_url)
             if len(body['items']) == 0:
                 return False
@@ -515,7 +737,8 @@ class ApiCheck:
         return _poll(
             _is_ready,
             "%s returning at least 1 result",
-            recommendations_url
+            recommendations_url,
+            profile=polling.DEFAULT
         )
 
     def _ensure_sane_response(self, response, url):
@@ -714,7 +937,7 @@ class JournalCheck:
     def redirect(self, path, expected, status_code=301):
         url = _build_url(path, self._host)
         LOGGER.info("Loading %s", url)
-        response = requests.get(url, allow_redirects=False)
+        response = http_client.get(url, allow_redirects=False)
         assert_status_code(response, status_code, url)
         location = response.headers['Location']
         assert location.startswith(self._host)
@@ -788,8 +1011,9 @@ class JournalCheck:
         return figure_download_links + pdf_download_links
 
 class HttpCheck:
-    def __init__(self, url):
+    def __init__(self, url, polling_profile=polling.DEFAULT):
         self._url = url
+        self._polling_profile = polling_profile
 
     def of(self, text_match=None, **kwargs):
         target = self._url.format(**kwargs)
@@ -797,26 +1021,31 @@ class HttpCheck:
             text_match_suffix = ' with text matching `%s`' % text_match
         else:
             text_match_suffix = ''
+        conditional_requests = ConditionalRequests()
         return _poll(
-            lambda: _is_content_present(target, text_match, **kwargs),
+            lambda: _is_content_present(target, text_match, conditional_requests=conditional_requests, **kwargs),
             "URL %s%s",
             target,
-            text_match_suffix
+            text_match_suffix,
+            profile=self._polling_profile
         )
 
 
 class GithubCheck:
-    def __init__(self, repo_url):
+    def __init__(self, repo_url, polling_profile=polling.SLOW):
         "repo_url must have a {path} placeholder in it that will be substituted with the file path"
         self._repo_url = repo_url
+        self._polling_profile = polling_profile
 
     def article(self, id, version=1, text_match=None):
         url = self._repo_url.format(path= '/articles/elife-%s-v%s.xml' % (id, version))
         error_message_suffix = (" and matching %s" % text_match) if text_match else ""
+        conditional_requests = ConditionalRequests()
         _poll(
-            lambda: _is_content_present(url, text_match=text_match, **{'id':id}),
+            lambda: _is_content_present(url, text_match=text_match, conditional_requests=conditional_requests, **{'id':id}),
             "article on github with URL %s existing" + error_message_suffix,
-            url
+            url,
+            profile=self._polling_profile
         )
 
 
@@ -825,7 +1054,7 @@ class NginxAutoindexJson:
         self._folder_url = folder_url
 
     def recent_files(self, after):
-        response = requests.get(self._folder_url)
+        response = http_client.get(self._folder_url)
         files = response.json()
         LOGGER.debug("Looking for MECA files after %s in %s", after, self._folder_url)
         files_urls = ["%s%s" % (self._folder_url, f['name']) for f in files if self._from_nginx_to_datetime(f['mtime']) >= after]
@@ -842,7 +1071,7 @@ class MecaFile:
         self._url = url
 
     def title(self):
-        response = requests.get(self._url)
+        response = http_client.get(self._url)
         zipbuffer = io.BytesIO(response.content)
         with zipfile.ZipFile(zipbuffer) as zip_file:
             article_xml = zip_file.read('article.xml')
@@ -861,7 +1090,8 @@ class MecaFiles:
             lambda: self._check_title(title, after),
             "MECA archive with title `%s` created after %s",
             title,
-            after
+            after,
+            profile=polling.SLOW
         )
 
     def _check_title(self, title, after):
@@ -871,9 +1101,15 @@ class MecaFiles:
         return (found, meca_titles)
 
 
-def _is_content_present(url, text_match=None, **extra):
+def _is_content_present(url, text_match=None, conditional_requests=None, **extra):
     try:
-        response = requests.get(url)
+        if conditional_requests:
+            response = conditional_requests.get(url)
+            if response is None:
+                LOGGER.debug("Body of %s not modified since last checked", url, extra=extra)
+                return False
+        else:
+            response = _coalesced_get(url)
         if response.status_code == 200:
             if text_match:
                 if text_match in response.text:
@@ -900,14 +1136,15 @@ class ObserverCheck:
         return _poll(
             lambda: self._is_present(url, id),
             "article with id %s at %s",
-            id, url
+            id, url,
+            profile=polling.DEFAULT
         )
 
     def _is_present(self, url_page_template, id):
         page = 1
         while True:
             url = url_page_template % page
-            response = requests.get(url)
+            response = _coalesced_get(url)
             LOGGER.debug("Loaded %s (%s)", url, response.status_code, extra={'id':id})
             if response.status_code > 299:
                 raise UnrecoverableError(response)
@@ -941,14 +1178,42 @@ class EPPCheck:
         assert json_resp['code'] == 200 and json_resp['status'] == 'OK'
         return json_resp
 
-def _poll(action_fn, error_message, *error_message_args):
-    return polling.poll(action_fn, error_message, *error_message_args)
+def _poll(action_fn, error_message, *error_message_args, profile=polling.DEFAULT):
+    return polling.poll(action_fn, error_message, *error_message_args, profile=profile)
+
+class ConditionalRequests:
+    VALIDATORS = {'ETag': 'If-None-Match', 'Last-Modified': 'If-Modified-Since'}
+
+    def __init__(self):
+        """Remembers the validators of the last 200 response for each URL, to send conditional GETs when polling it again.
+
+        Use a new instance for each poll: a 304 Not Modified only means the content is the same as in the previous attempt,
+        which was therefore not satisfactory."""
+        self._validators = {}
+
+    def get(self, url, getter=http_client.get, headers=None, **kwargs):
+        "returns the response, or None if the resource has not been modified since the last 200 response"
+        conditional_headers = dict(headers) if headers else {}
+        conditional_headers.update(self._validators.get(url, {}))
+        response = _coalesced_get(url, getter=getter, headers=conditional_headers, **kwargs)
+        if response.status_code == 304:
+            return None
+        if response.status_code == 200:
+            self._validators[url] = {header: response.headers[validator] for validator, header in self.VALIDATORS.items() if validator in response.headers}
+        else:
+            self._validators.pop(url, None)
+        return response
+
+IN_FLIGHT = SingleFlight()
+
+def _coalesced_get(url, getter=http_client.get, **kwargs):
+    "issues a GET through `getter`, unless an identical one is already in flight in this process: its response is then shared"
+    key = ('GET', url, tuple(sorted((name, pformat(value)) for name, value in kwargs.items())))
+    return IN_FLIGHT.call(key, lambda: getter(url, **kwargs))
 
 def _log_connection_error(e):
     LOGGER.debug("Connection error, will retry: %s", e)
 
-RESOURCE_CACHE = {}
-
 def _assert_all_resources_of_page_load(html_content, host, resource_checking_method='head', **extra):
     """Checks that all <script>, <link>, <video>, <source>, srcset="" load, by issuing HEAD requests that must give 200 OK.
 
@@ -994,35 +1259,13 @@ def _assert_all_load(resources, host, resource_checking_method='head', **extra):
     urls = []
     futures = []
 
-    # lsh@2023-07-26: iiif occasionally resets a network connection on initial/early requests. unsure why.
-    # `retries.retry_request` only handles status code failures and not network connection issues.
-    # - https://github.com/elifesciences/issues/issues/8422
-    # - https://urllib3.readthedocs.io/en/stable/user-guide.html#retrying-requests
-    # - https://urllib3.readthedocs.io/en/stable/reference/urllib3.util.html#urllib3.util.Retry
-    requests_session = requests.Session()
-    requests_session.mount('https://', requests.adapters.HTTPAdapter(max_retries=Retry(**{
-        'total': retries.MAX_RETRIES,
-        'connect': retries.MAX_RETRIES,
-        'read': retries.MAX_RETRIES,
-        # A set of integer HTTP status codes that we should force a retry on.
-        'status_forcelist': [], # disabled, allow `retries.retry_request` to handle these.
-        # {backoff factor} * (2 ** {number of previous retries})
-        # 0.3 => 0.3, 0.6, 1.2 seconds
-        'backoff_factor': 0.3,
-    })))
-    session = FuturesSession(max_workers=2, session=requests_session)
-    for path in resources:
-        if path is None:
-            LOGGER.warning("empty path in resources: %s", resources)
-            continue
-
-        if path.startswith("data:"):
-            LOGGER.debug("Skipping `data:` resource '%s'", path)
-            continue
-
-        url = _build_url(path, host)
-        if url in RESOURCE_CACHE and resource_checking_method == 'head':
-            LOGGER.debug("Cached HEAD %s: %s", url, RESOURCE_CACHE[url], extra=extra)
+    # the shared session retries connection errors, see `http_client`
+    session = FuturesSession(max_workers=2, session=http_client.session())
+    all_urls = _resource_urls(resources, host)
+    cached = RESOURCE_CACHE.get_many(resource_checking_method, all_urls)
+    for url in all_urls:
+        if url in cached:
+            LOGGER.debug("Cached %s %s: %s", resource_checking_method.upper(), url, cached[url], extra=extra)
             continue
         urls.append(url)
         futures.append(getattr(session, resource_checking_method)(url))
@@ -1030,6 +1273,7 @@ def _assert_all_load(resources, host, resource_checking_method='head', **extra):
     wait(futures, HTTP_TIMEOUT)
 
     failures = []
+    loaded = {}
 
     for url, future in zip(urls, futures):
         response = future.result()
@@ -1038,108 +1282,154 @@ def _assert_all_load(resources, host, resource_checking_method='head', **extra):
         if retries.retry_request(response):
             LOGGER.warning("Loading (%s) resource %s again due to %s status code", \
                            resource_checking_method, url, response.status_code, extra=extra)
-            response = requests.get(url)
+            response = http_client.get(url)
 
         try:
             assert_status_code(response, 200, url)
-            RESOURCE_CACHE[url] = response.status_code
+            loaded[url] = response.status_code
         except AssertionError as e:
             failures.append(str(e))
 
+    RESOURCE_CACHE.put_many(resource_checking_method, loaded)
     assert not failures, "%s requests failed:\n%s" % (len(failures), "\n".join(failures))
 
+def _resource_urls(resources, host):
+    urls = []
+    for path in resources:
+        if path is None:
+            LOGGER.warning("empty path in resources: %s", resources)
+            continue
+
+        if path.startswith("data:"):
+            LOGGER.debug("Skipping `data:` resource '%s'", path)
+            continue
+
+        urls.append(_build_url(path, host))
+    return urls
+
 def _build_url(path, host):
     if path.startswith("http://") or path.startswith("https://"):
         return path
     assert path.startswith("/"), ("I found a non-absolute path %s and I don't know how to load it" % path)
     return "%s%s" % (host, path)
 
+# optional, S3 event notifications of objects created in the buckets below
+BUCKET_NOTIFICATIONS = BucketNotifications(
+    aws.SQS,
+    SETTINGS['queue_bucket_notifications']
+) if SETTINGS.get('queue_bucket_notifications') else None
 ARCHIVE = BucketFileCheck(
     aws.S3,
     SETTINGS['bucket_archive'],
     # notice {{12}} is the escaping for {6} in the regex,
     # it should not be substituted
     'elife-{id}-(poa|vor)-v{version}-20[0-9]{{12}}.zip',
-    'elife-{id}-'
+    'elife-{id}-',
+    polling_profile=polling.SLOW,
+    notifications=BUCKET_NOTIFICATIONS
 )
 PERSONALISED_COVERS_A4 = BucketFileCheck(
     aws.S3,
     SETTINGS['bucket_covers'],
-    '{id}-cover-a4.pdf',
-    '{id}-'
+    '{id}-cover-a4\\.pdf',
+    '{id}-',
+    notifications=BUCKET_NOTIFICATIONS
 )
 PERSONALISED_COVERS_LETTER = BucketFileCheck(
     aws.S3,
     SETTINGS['bucket_covers'],
-    '{id}-cover-letter.pdf',
-    '{id}-'
+    '{id}-cover-letter\\.pdf',
+    '{id}-',
+    notifications=BUCKET_NOTIFICATIONS
 )
+# any file of an article: use with `all_of()` and the criteria of the checks below
+PUBLISHED_CDN_BUCKET = BucketFileCheck(
+    aws.S3,
+    SETTINGS['bucket_published'],
+    'articles/{id}/',
+    'articles/{id}/',
+    notifications=BUCKET_NOTIFICATIONS
+)
+
 IMAGES_PUBLISHED_CDN_BUCKET = BucketFileCheck(
     aws.S3,
     SETTINGS['bucket_published'],
+    'articles/{id}/elife-{id}-{figure_name}-v{version}\\.jpg',
     'articles/{id}/elife-{id}-{figure_name}-v{version}.jpg',
-    'articles/{id}/elife-{id}-{figure_name}-v{version}.jpg'
+    notifications=BUCKET_NOTIFICATIONS
 )
 XML_PUBLISHED_CDN_BUCKET = BucketFileCheck(
     aws.S3,
     SETTINGS['bucket_published'],
+    'articles/{id}/elife-{id}-v{version}\\.xml',
     'articles/{id}/elife-{id}-v{version}.xml',
-    'articles/{id}/elife-{id}-v{version}.xml'
+    notifications=BUCKET_NOTIFICATIONS
 )
 PDF_PUBLISHED_CDN_BUCKET = BucketFileCheck(
     aws.S3,
     SETTINGS['bucket_published'],
+    'articles/{id}/elife-{id}-v{version}\\.pdf',
     'articles/{id}/elife-{id}-v{version}.pdf',
-    'articles/{id}/elife-{id}-v{version}.pdf'
+    notifications=BUCKET_NOTIFICATIONS
 )
 DIGEST_JPG_PUBLISHED_CDN_BUCKET = BucketFileCheck(
     aws.S3,
     SETTINGS['bucket_published'],
+    'digests/{id}/digest-{id}\\.jpg',
     'digests/{id}/digest-{id}.jpg',
-    'digests/{id}/digest-{id}.jpg'
+    notifications=BUCKET_NOTIFICATIONS
 )
 PACKAGING_BUCKET_OUTBOX = BucketFileCheck(
     aws.S3,
     SETTINGS['bucket_packaging'],
+    '{vendor}/outbox/elife{id}\\.xml',
     '{vendor}/outbox/elife{id}.xml',
-    '{vendor}/outbox/elife{id}.xml'
+    notifications=BUCKET_NOTIFICATIONS
 )
 PACKAGING_BUCKET_BATCH = BucketFileCheck(
     aws.S3,
     SETTINGS['bucket_packaging'],
     # could probably pass in the date as {date}
     '{vendor}/published/20[0-9]{{6}}/batch/(elife-.*\\.xml)',
-    '{vendor}/published/'
+    '{vendor}/published/',
+    start_after='{vendor}/published/{last_modified_after:%Y%m%d}',
+    polling_profile=polling.SLOW,
+    notifications=BUCKET_NOTIFICATIONS
 )
 PACKAGING_BUCKET_POA_ZIP = BucketFileCheck(
     aws.S3,
     SETTINGS['bucket_packaging'],
+    'outbox/elife_poa_e{id}_ds\\.zip',
     'outbox/elife_poa_e{id}_ds.zip',
-    'outbox/elife_poa_e{id}_ds.zip'
+    notifications=BUCKET_NOTIFICATIONS
 )
 PACKAGING_BUCKET_POA_XML = BucketFileCheck(
     aws.S3,
     SETTINGS['bucket_packaging'],
+    'outbox/elife_poa_e{id}\\.xml',
     'outbox/elife_poa_e{id}.xml',
-    'outbox/elife_poa_e{id}.xml'
+    notifications=BUCKET_NOTIFICATIONS
 )
 PACKAGING_BUCKET_POA_PDF = BucketFileCheck(
     aws.S3,
     SETTINGS['bucket_packaging'],
+    'outbox/decap_elife_poa_e{id}\\.pdf',
     'outbox/decap_elife_poa_e{id}.pdf',
-    'outbox/decap_elife_poa_e{id}.pdf'
+    notifications=BUCKET_NOTIFICATIONS
 )
 BOT_INTERNAL_DIGEST_OUTBOX_DOC = BucketFileCheck(
     aws.S3,
     SETTINGS['bucket_configuration'],
+    'digests/outbox/{id}/digest-{id}\\.docx',
     'digests/outbox/{id}/digest-{id}.docx',
-    'digests/outbox/{id}/digest-{id}.docx',
+    notifications=BUCKET_NOTIFICATIONS
 )
 BOT_INTERNAL_DIGEST_OUTBOX_JPG = BucketFileCheck(
     aws.S3,
     SETTINGS['bucket_configuration'],
+    'digests/outbox/{id}/digest-{id}\\.jpg',
     'digests/outbox/{id}/digest-{id}.jpg',
-    'digests/outbox/{id}/digest-{id}.jpg',
+    notifications=BUCKET_NOTIFICATIONS
 )
 DASHBOARD = DashboardArticleCheck(
     host=SETTINGS['dashboard_host'],
@@ -0,0 +1,56 @@
+"""utility library for sharing a single call between concurrent callers asking for the same thing.
+
+contains no tests to be run."""
+
+import threading
+
+from spectrum import logger
+
+LOGGER = logger.logger(__name__)
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    def __init__(self):
+        """Executes at most one call per key at any given time.
+
+        Callers asking for a key while a call for it is in flight wait for that call and share its result (or exception),
+        rather than issuing a call of their own. Nothing is cached after the call completes.
+
+        Calls are only shared between the threads of the current process, e.g. checks polled in parallel by a test
+        or articles generated by the prefetcher: the xdist workers running other tests each make their own calls."""
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def call(self, key, action_fn):
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._in_flight[key] = call
+            else:
+                call.waiters = call.waiters + 1
+        if not leader:
+            LOGGER.debug("Joining in-flight call %s", key)
+            call.done.wait()
+            if call.error:
+                raise call.error
+            return call.result
+        try:
+            call.result = action_fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            if call.waiters:
+                LOGGER.debug("Shared call %s with %d other callers", key, call.waiters)
+            call.done.set()
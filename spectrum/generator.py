@@ -2,21 +2,40 @@
 
 contains no test to be run."""
 
+import collections
+import contextlib
 import glob
+import io
 import os
 from os import path
 import random
 import re
 import shutil
+import tempfile
+import threading
+import time
 import zipfile
 
-import docx
 import jinja2
-from spectrum import logger
+from spectrum import logger, manifest, zips
 from spectrum.config import COMMON
 
 LOGGER = logger.logger(__name__)
 
+# generated zips up to this size are kept in memory, larger ones in an anonymous temporary file
+SPOOL_MAX_SIZE = int(os.environ.get('SPECTRUM_SPOOL_MAX_SIZE', 32 * 1024 * 1024))
+# files of EJP zips that may contain the article id, all others are copied as they are
+EJP_TEXT_EXTENSIONS = ('.xml', '.txt', '.csv', '.htm', '.html', '.json')
+# compiled templates kept in memory, enough for all of spectrum/templates
+TEMPLATE_CACHE_SIZE = 100
+# the manuscript number in the digest docx, replaced by the article id
+DIGEST_MANUSCRIPT_NUMBER_TEMPLATE = '99999'
+DIGEST_DOCX = 'spectrum/templates/digests/DIGEST %s.docx' % DIGEST_MANUSCRIPT_NUMBER_TEMPLATE
+DIGEST_DOCUMENT_XML = 'word/document.xml'
+# the text of the run following the MANUSCRIPT NUMBER one, in the same paragraph
+DIGEST_MANUSCRIPT_NUMBER = re.compile(br'MANUSCRIPT NUMBER</w:t>(?:(?!</w:p>).)*?<w:t(?: [^>]*)?>([^<]*)</w:t>', re.DOTALL)
+DIGEST_IMAGE = 'spectrum/templates/digests/alligator.jpg'
+
 def generate_article_id(msid):
     "given a regular 6-digit `msid`, generates a msid with a random prefix"
     msid = int(msid)
@@ -37,28 +56,25 @@ def generate_article_id(msid):
     return str((prefix * offset) + msid)
 
 def article_zip(template_id, article_id=None, template_variables=None):
+    """Generates a zip of the template with the article id replaced.
+
+    The zip is written straight into a spooled file rather than from a directory on disk,
+    see ArticleZip for how to access it.
+    Static files are spliced in from the base archive of the template, only templates are rendered"""
     if template_variables is None:
         template_variables = {}
-    (template, kind) = _choose_template(template_id)
+    template = manifest.template(template_id)
     if article_id is None:
         article_id = generate_article_id(template_id)
-    generated_article_directory = '%s/elife-%s-%s-r1' % (COMMON['tmp'], article_id, kind)
-    os.mkdir(generated_article_directory)
-    generated_files = []
-    for file in glob.glob(template + "/*"):
-        generated_file = _generate(file, article_id, generated_article_directory, template_id, template_variables)
-        generated_files.append(generated_file)
-    zip_filename = generated_article_directory + '.zip'
-    figure_names = []
-    with zipfile.ZipFile(zip_filename, 'w') as zip_file:
-        for generated_file in generated_files:
-            zip_file.write(generated_file, path.basename(generated_file))
-            match = re.match(r".*/elife-\d+-(.+).tif", generated_file)
-            if match:
-                figure_names.append(match.groups()[0])
-    LOGGER.info("Generated %s with figures %s", zip_filename, figure_names, extra={'id': article_id})
-    has_pdf = len(glob.glob(template + "/*.pdf")) >= 1
-    return ArticleZip(article_id, zip_filename, generated_article_directory, revision=1, version=1, figure_names=figure_names, has_pdf=has_pdf)
+    zip_filename = '%s/elife-%s-%s-r1.zip' % (COMMON['tmp'], article_id, template['kind'])
+    base_archive = _base_archive(template)
+    contents = _zip_file(path.getsize(base_archive))
+    with zipfile.ZipFile(contents, 'w') as zip_file:
+        _splice(base_archive, zip_file, template_id, article_id)
+        for file in template['jinja']:
+            _generate(file, article_id, zip_file, template_id, template_variables)
+    LOGGER.info("Generated %s with figures %s", zip_filename, template['figure_names'], extra={'id': article_id})
+    return ArticleZip(article_id, zip_filename, revision=1, version=1, figure_names=list(template['figure_names']), has_pdf=template['has_pdf'], contents=contents)
 
 def article_ejp_csv(source_csv, target_article_id, source_article_id=36157):
     generated_ejp_directory = '%s/poa-%s' % (COMMON['tmp'], target_article_id)
@@ -77,12 +93,12 @@ def article_ejp_csv(source_csv, target_article_id, source_article_id=36157):
     return generated_csv
 
 def article_ejp_zip(source_zip, target_article_id, source_article_id=36157):
-    def _substitute_article_id(text):
-        return re.sub(
-            r"eLife\.%s\b" % source_article_id,
-            "eLife.%s" % str(target_article_id),
-            text
-        )
+    """Copies source_zip replacing eLife.<source_article_id> with eLife.<target_article_id> in its text files.
+
+    Text files are streamed through the substitution a chunk at a time, all other files are copied without being decompressed."""
+    source_doi_suffix = ("eLife.%s" % source_article_id).encode()
+    pattern = re.compile(re.escape(source_doi_suffix) + br"\b")
+    replacement = ("eLife.%s" % target_article_id).encode()
 
     # 50142_1_supp_mat_highwire_zip_853595_pxvg3m.zip
     zip_prefix = random.randrange(1000000000, 9999999999 + 1)
@@ -93,38 +109,91 @@ def article_ejp_zip(source_zip, target_article_id, source_article_id=36157):
 
     with zipfile.ZipFile(source_zip, 'r') as source_zip_file:
         with zipfile.ZipFile(generated_ejp_zip_filename, 'w') as zip_file:
-            for source_archived_filename in source_zip_file.namelist():
-                with source_zip_file.open(source_archived_filename, 'r') as source_archived_file:
-                    zip_file.writestr(source_archived_filename, _substitute_article_id(source_archived_file.read()))
+            for info in source_zip_file.infolist():
+                if path.splitext(info.filename)[1].lower() not in EJP_TEXT_EXTENSIONS:
+                    zips.copy_member(source_zip_file, info, zip_file)
+                    continue
+                target_info = zipfile.ZipInfo(info.filename, info.date_time)
+                target_info.compress_type = info.compress_type
+                with source_zip_file.open(info, 'r') as source_archived_file:
+                    with zip_file.open(target_info, 'w') as target_archived_file:
+                        _substitute_stream(source_archived_file, target_archived_file, pattern, replacement, len(source_doi_suffix))
 
     LOGGER.info("Generated EJP POA zip %s", generated_ejp_zip_filename, extra={'id': target_article_id})
 
     return generated_ejp_zip_filename
 
-def digest_zip(template_id):
-    standard_input = 'spectrum/templates/digests/DIGEST 99999.docx'
-    article_id = generate_article_id(template_id)
-    target_doc_filename = '%s/DIGEST %s.docx' % (COMMON['tmp'], article_id)
-
-    word_document = docx.Document(standard_input)
-    doi_paragraphs = [p for p in word_document.paragraphs if p.runs[0].text == 'MANUSCRIPT NUMBER\n']
-    assert len(doi_paragraphs) == 1, "Wrong number of MANUSCRIPT NUMBER paragraphs: %s" % [p.text for p in word_document.paragraphs]
-    doi_paragraphs[0].runs[1].text = '%s' % article_id
-    word_document.save(target_doc_filename)
+def _substitute_stream(source, target, pattern, replacement, max_match_length, chunk_size=1024 * 1024):
+    """writes source to target replacing every match of pattern, a chunk at a time.
+
+    A match can span two chunks, so the end of each chunk that could be the start of a match is held back for the next one,
+    together with one more byte for a trailing \\b to look at."""
+    held_back = max_match_length + 1
+    carry = b''
+    while True:
+        chunk = source.read(chunk_size)
+        buffer = carry + chunk
+        if not chunk:
+            target.write(pattern.sub(replacement, buffer))
+            return
+        safe_limit = len(buffer) - held_back
+        position = 0
+        for match in pattern.finditer(buffer):
+            if match.start() >= safe_limit:
+                break
+            target.write(buffer[position:match.start()])
+            target.write(replacement)
+            position = match.end()
+        cut = max(position, safe_limit)
+        target.write(buffer[position:cut])
+        carry = buffer[cut:]
 
-    LOGGER.info("Generated digest doc %s", target_doc_filename, extra={'id': article_id})
+def digest_zip(template_id):
+    """Generates a zip of the digest template with the manuscript number replaced, alongside its image.
 
-    generated_files = [target_doc_filename, 'spectrum/templates/digests/alligator.jpg']
+    The docx is written straight into the zip: only its word/document.xml is patched, every other part is copied as it is"""
+    article_id = generate_article_id(template_id)
+    digest_template = _digest_template()
     target_zip_filename = '%s/DIGEST %s.zip' % (COMMON['tmp'], article_id)
     with zipfile.ZipFile(target_zip_filename, 'w') as zip_file:
-        for generated_file in generated_files:
-            zip_file.write(generated_file, path.basename(generated_file))
+        with zip_file.open(zipfile.ZipInfo('DIGEST %s.docx' % article_id, time.localtime()[:6]), 'w') as docx_file:
+            with zipfile.ZipFile(io.BytesIO(digest_template.docx_contents)) as template_docx, zipfile.ZipFile(docx_file, 'w') as target_docx:
+                for info in template_docx.infolist():
+                    if info.filename == DIGEST_DOCUMENT_XML:
+                        document_xml = digest_template.before_manuscript_number + article_id.encode('utf-8') + digest_template.after_manuscript_number
+                        target_docx.writestr(info.filename, document_xml, compress_type=info.compress_type)
+                    else:
+                        zips.copy_member(template_docx, info, target_docx)
+        zip_file.write(DIGEST_IMAGE, path.basename(DIGEST_IMAGE))
 
     LOGGER.info("Generated digest zip %s", target_zip_filename, extra={'id': article_id})
-    os.remove(target_doc_filename)
 
     return DigestZip(article_id, target_zip_filename)
 
+_DigestTemplate = collections.namedtuple('_DigestTemplate', ['docx_contents', 'before_manuscript_number', 'after_manuscript_number'])
+_DIGEST_TEMPLATE = {'template': None}
+_DIGEST_TEMPLATE_LOCK = threading.Lock()
+
+def _digest_template():
+    """the contents of the digest docx, and its word/document.xml split around the manuscript number.
+
+    Read once per process, failing if the manuscript number is not the whole text of a single run, e.g. when Word split it"""
+    with _DIGEST_TEMPLATE_LOCK:
+        if _DIGEST_TEMPLATE['template'] is None:
+            with open(DIGEST_DOCX, 'rb') as docx_file:
+                docx_contents = docx_file.read()
+            with zipfile.ZipFile(io.BytesIO(docx_contents)) as template_docx:
+                document_xml = template_docx.read(DIGEST_DOCUMENT_XML)
+            manuscript_numbers = list(DIGEST_MANUSCRIPT_NUMBER.finditer(document_xml))
+            assert len(manuscript_numbers) == 1, "Wrong number of MANUSCRIPT NUMBER paragraphs in %s: %s" % (DIGEST_DOCX, [m.group(0) for m in manuscript_numbers])
+            manuscript_number = manuscript_numbers[0]
+            occurrences = document_xml.count(DIGEST_MANUSCRIPT_NUMBER_TEMPLATE.encode('utf-8'))
+            assert manuscript_number.group(1) == DIGEST_MANUSCRIPT_NUMBER_TEMPLATE.encode('utf-8') and occurrences == 1, (
+                "Expected the manuscript number %s once in its own run in %s, found %s and %d occurrences" % (DIGEST_MANUSCRIPT_NUMBER_TEMPLATE, DIGEST_DOCX, manuscript_number.group(1).decode('utf-8'), occurrences)
+            )
+            _DIGEST_TEMPLATE['template'] = _DigestTemplate(docx_contents, document_xml[:manuscript_number.start(1)], document_xml[manuscript_number.end(1):])
+        return _DIGEST_TEMPLATE['template']
+
 
 def generate_article_title():
     return 'My spectrum article %s' % random.randrange(1, 1000000000000)
@@ -144,58 +213,95 @@ def all_stored_articles():
 
     However, excludes some blacklisted articles that we prefer to use with a specific test rather than the standard ingest-and-publish"""
     blacklist = ['19532', '06847', '22661']
-    articles = []
-    for template_directory in glob.glob('spectrum/templates/elife-*-*-*'):
-        match = re.match(r".*/elife-(\d+)-.+", template_directory)
-        assert match is not None, ("Cannot match an article id into %s" % template_directory)
-        assert len(match.groups()) == 1
-        article_id = match.groups()[0]
-        if article_id in blacklist:
-            continue
-        articles.append(article_id)
-    articles.sort()
-    return articles
-
-def _choose_template(template_id):
-    templates_pattern = './spectrum/templates/elife-%s-*-*' % template_id
-    templates_found = glob.glob(templates_pattern)
-    assert len(templates_found) > 0, "No candidate templates found for: %s" % templates_pattern
-    assert len(templates_found) == 1, "Found multiple candidate templates: %s" % templates_found
-    chosen = templates_found[0]
-    match = re.match(r'.*/elife-\d+-(vor|poa)-(r|v)\d+', chosen)
-    assert match is not None, ("Bad name for template directory %s" % chosen)
-    assert len(match.groups()) == 2
-    kind = match.groups()[0] # vor or poa
-    return (chosen, kind)
-
-
-def _generate(filename, id, generated_article_directory, template_id, template_variables):
+    return sorted(template['id'] for template in manifest.templates() if template['id'] not in blacklist)
+
+def _generate(filename, id, zip_file, template_id, template_variables):
+    "adds the generated version of the template file to zip_file, returning its name"
     filename_components = path.splitext(filename)
     generated_filename = path.basename(filename).replace(template_id, id)
-    target = generated_article_directory + '/' + generated_filename
     assert len(filename_components) == 2
     extension = filename_components[1]
     if extension == '.jinja':
-        with open(filename, 'r') as template_file:
-            data = template_file.read()
-        template = jinja2.Template(data)
+        template = _template_environment().get_template(filename)
         content = template.render(article={'id': id}, **template_variables)
-        target = target.replace('.jinja', '')
-        with open(target, 'w') as target_file:
-            target_file.write(content)
+        generated_filename = generated_filename.replace('.jinja', '')
+        zip_file.writestr(generated_filename, content)
     else:
-        shutil.copy(filename, target)
-    return target
+        zip_file.write(filename, generated_filename)
+    return generated_filename
+
+_TEMPLATE_ENVIRONMENT = {'environment': None}
+_TEMPLATE_ENVIRONMENT_LOCK = threading.Lock()
+
+def _template_environment():
+    """the jinja2.Environment shared by the current process, created on first use.
+
+    Compiled templates are kept in memory until their file is modified,
+    and their bytecode in COMMON['tmp'] so that other processes don't have to compile them again."""
+    with _TEMPLATE_ENVIRONMENT_LOCK:
+        if _TEMPLATE_ENVIRONMENT['environment'] is None:
+            bytecode_directory = path.join(COMMON['tmp'], 'jinja-bytecode')
+            os.makedirs(bytecode_directory, exist_ok=True)
+            _TEMPLATE_ENVIRONMENT['environment'] = jinja2.Environment(
+                loader=jinja2.FileSystemLoader('.'),
+                auto_reload=True,
+                cache_size=TEMPLATE_CACHE_SIZE,
+                bytecode_cache=jinja2.FileSystemBytecodeCache(bytecode_directory)
+            )
+        return _TEMPLATE_ENVIRONMENT['environment']
+
+def _spooled_file():
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, dir=COMMON['tmp'])
+
+def _zip_file(expected_size):
+    "a file for a zip of about expected_size bytes: a regular temporary file for large ones, so that zips.copy_member can copy data without reading it"
+    if expected_size > SPOOL_MAX_SIZE:
+        return tempfile.TemporaryFile(dir=COMMON['tmp'])
+    return _spooled_file()
+
+def _splice(base_archive, zip_file, template_id, article_id):
+    "copies the files of base_archive into zip_file replacing template_id with article_id in their names"
+    with zipfile.ZipFile(base_archive) as base_zip_file:
+        for info in base_zip_file.infolist():
+            zips.copy_member(base_zip_file, info, zip_file, info.filename.replace(template_id, article_id))
+
+def _base_archive(template):
+    """a zip of the static files of the template, with their original names, created on first use.
+
+    Recreated when any file in the template is newer than it."""
+    base_archive = path.join(COMMON['tmp'], 'template-bases', template['name'] + '.zip')
+    static_files = template['files']
+    newest = max([path.getmtime(template['path'])] + [path.getmtime(file) for file in static_files])
+    if path.exists(base_archive) and path.getmtime(base_archive) >= newest:
+        return base_archive
+    os.makedirs(path.dirname(base_archive), exist_ok=True)
+    # other processes may be creating the same archive, and must never see it half written
+    partial_base_archive = '%s.%s-%s.partial' % (base_archive, os.getpid(), threading.get_ident())
+    with zipfile.ZipFile(partial_base_archive, 'w') as zip_file:
+        for file in static_files:
+            zip_file.write(file, path.basename(file))
+    os.replace(partial_base_archive, base_archive)
+    LOGGER.info("Created base archive %s", base_archive)
+    return base_archive
 
 class ArticleZip:
-    def __init__(self, id, filename, directory, revision, version, figure_names=None, has_pdf=False):
+    def __init__(self, id, filename, revision, version, figure_names=None, has_pdf=False, contents=None):
+        """A generated article zip.
+
+        contents is an optional file object holding the zip, in which case the zip is only written to filename
+        when filename() is called.
+
+        Revisions share the zip with the article they come from, until replace_in_text() gives them their own."""
         self._id = id
         self._filename = filename
-        self._directory = directory
         self._revision = revision
         self._version = version
         self._figure_names = figure_names if figure_names else []
         self._has_pdf = has_pdf
+        if contents is None or isinstance(contents, _SharedFile):
+            self._contents = contents
+        else:
+            self._contents = _SharedFile(contents)
 
     def id(self):
         return self._id
@@ -207,8 +313,26 @@ class ArticleZip:
         return self._version
 
     def filename(self):
+        "the path of the zip on disk, writing it there if necessary: prefer open() where possible"
+        if self._contents is not None and not path.exists(self._filename):
+            with self.open() as zip_contents:
+                with open(self._filename, 'wb') as zip_file:
+                    shutil.copyfileobj(zip_contents, zip_file)
         return self._filename
 
+    def basename(self):
+        return path.basename(self._filename)
+
+    @contextlib.contextmanager
+    def open(self):
+        "the zip as a binary file object of its own, positioned at the start, even while other revisions sharing it are reading it"
+        if self._contents is None:
+            with open(self._filename, 'rb') as zip_file:
+                yield zip_file
+        else:
+            with self._contents.reader() as zip_contents:
+                yield zip_contents
+
     def figure_names(self):
         return self._figure_names
 
@@ -222,46 +346,116 @@ class ArticleZip:
             new_version = self._version
         new_revision = self._revision + 1
         new_filename = re.sub(r'-(r|v)\d+.zip$', ('-r%s.zip' % new_revision), self._filename)
-        shutil.copy(self._filename, new_filename)
-        new_directory = re.sub(r'-(r|v)\d+$', ('-r%s' % new_revision), self._directory)
-        shutil.copytree(self._directory, new_directory)
-        return ArticleZip(self._id, new_filename, new_directory, new_revision, new_version, self._figure_names, self._has_pdf)
+        return self._copy(new_filename, new_revision, new_version)
 
     def new_version(self, version):
         # what is changed is actually the "run"
         new_revision = self._revision + 1
         new_filename = re.sub(r'-(r|v)\d+.zip$', ('-v%s.zip' % version), self._filename)
-        shutil.copy(self._filename, new_filename)
-        new_directory = re.sub(r'-(r|v)\d+$', ('-v%s' % version), self._directory)
-        shutil.copytree(self._directory, new_directory)
-        return ArticleZip(self._id, new_filename, new_directory, new_revision, version, self._figure_names, self._has_pdf)
+        return self._copy(new_filename, new_revision, version)
+
+    def _copy(self, new_filename, new_revision, new_version):
+        "a copy sharing the zip with this article: nothing is copied until it is modified"
+        if self._contents is None:
+            _link_or_copy(self._filename, new_filename)
+            shared_contents = None
+        else:
+            shared_contents = self._contents.share()
+        return ArticleZip(self._id, new_filename, new_revision, new_version, self._figure_names, self._has_pdf, shared_contents)
 
     def replace_in_text(self, replacements):
-        """Beware: violates immutability, as it modifies the file in place for performance reasons"""
+        """Modifies the XML of this article, without affecting any other revision sharing its files.
+
+        All replacements are made in a single pass over each XML file, the longest search string winning where several match.
+        Only the XML files that change are written again, all other files are copied as they are."""
         LOGGER.info("Replacing %s in article", replacements, extra={'id': self._id})
-        with zipfile.ZipFile(self._filename, 'w') as zip_file:
-            for file in glob.glob(self._directory + "/*"):
-                if file.endswith('.xml'):
-                    with open(file) as xml:
-                        contents = xml.read()
-                    for search, replace in replacements.items():
-                        contents = contents.replace(search, replace)
-                    with open(file, 'w') as xml:
-                        xml.write(contents)
-                zip_file.write(file, path.basename(file))
+        if not replacements:
+            return self
+        pattern = re.compile('|'.join(re.escape(search) for search in sorted(replacements, key=len, reverse=True)))
+        with self.open() as zip_contents:
+            if self._contents is not None:
+                new_contents = _zip_file(_size(zip_contents))
+                target = new_contents
+            else:
+                # not in place, the zip may be a hard link to the one of another revision
+                target = self._filename + '.partial'
+            with zipfile.ZipFile(zip_contents) as source, zipfile.ZipFile(target, 'w') as zip_file:
+                for info in source.infolist():
+                    if info.filename.endswith('.xml'):
+                        (contents, count) = pattern.subn(lambda match: replacements[match.group(0)], source.read(info).decode('utf-8'))
+                        if count:
+                            zip_file.writestr(info.filename, contents, compress_type=info.compress_type)
+                            continue
+                    zips.copy_member(source, info, zip_file)
+        if self._contents is not None:
+            self._contents.release()
+            self._contents = _SharedFile(new_contents)
+            # written from the previous contents, filename() writes it again
+            if path.exists(self._filename):
+                os.remove(self._filename)
+        else:
+            os.replace(target, self._filename)
         return self
 
     def clean(self):
+        if self._contents is not None:
+            self._contents.release()
+            self._contents = None
         if os.path.exists(self._filename):
             os.remove(self._filename)
             LOGGER.info("Deleted file %s", self._filename)
         else:
             LOGGER.info("Not deleted file %s because it doesn't exist", self._filename)
-        if os.path.exists(self._directory):
-            shutil.rmtree(self._directory)
-            LOGGER.info("Deleted directory %s", self._directory)
+
+class _SharedFile:
+    def __init__(self, file):
+        "A file shared by several revisions of an article, closed when the last of them releases it"
+        self.file = file
+        self._users = 1
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def reader(self):
+        """a handle on the file with its own position, for reading it at the same time as other revisions.
+
+        In-memory contents are read through a BytesIO sharing them, files are opened again through /proc/self/fd,
+        only where that is not available the file itself is repositioned at the start"""
+        if isinstance(self.file, tempfile.SpooledTemporaryFile) and not self.file._rolled: # pylint: disable=protected-access
+            with io.BytesIO(self.file._file.getvalue()) as handle: # pylint: disable=protected-access
+                yield handle
+        elif path.isdir('/proc/self/fd'):
+            self.file.flush()
+            with open('/proc/self/fd/%d' % self.file.fileno(), 'rb') as handle:
+                yield handle
         else:
-            LOGGER.info("Not deleted directory %s because it doesn't exist", self._directory)
+            self.file.seek(0)
+            yield self.file
+
+    def share(self):
+        with self._lock:
+            self._users = self._users + 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._users = self._users - 1
+            if self._users == 0:
+                self.file.close()
+
+def _link_or_copy(source, destination):
+    "a hard link where the file system allows it: files shared this way must be replaced rather than modified in place"
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+    return destination
+
+def _size(fileobj):
+    "the size of a file object, which is left positioned at the start"
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    return size
 
 def article_subjects(ids_to_subjects):
     maximum_suffix = 999999999
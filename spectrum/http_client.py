@@ -0,0 +1,167 @@
+"""utility library providing a process-wide HTTP session, so that checks reuse keep-alive connections to each host
+rather than opening a new TCP+TLS connection for every request.
+
+contains no tests to be run."""
+
+from collections import deque
+import http.cookiejar
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError
+from urllib3.util.retry import Retry
+
+# imported for its side effect of setting the global default User-Agent before any session is created
+from spectrum import config # pylint: disable=unused-import
+from spectrum import logger
+from spectrum.exceptions import UnrecoverableError
+
+LOGGER = logger.logger(__name__)
+
+# how many hosts to keep a pool of connections for
+POOL_CONNECTIONS = int(os.environ.get('SPECTRUM_HTTP_POOL_CONNECTIONS', 20))
+# how many connections to keep open to each host
+POOL_MAXSIZE = int(os.environ.get('SPECTRUM_HTTP_POOL_MAXSIZE', 10))
+# connection and read errors, not status codes: see `retries.retry_request` for those
+CONNECTION_RETRIES = 3
+# consecutive connection errors or 5xx responses from a host before failing fast all requests to it
+CIRCUIT_BREAKER_THRESHOLD = int(os.environ.get('SPECTRUM_CIRCUIT_BREAKER_THRESHOLD', 10))
+# seconds to fail fast before letting a request through again
+CIRCUIT_BREAKER_COOLDOWN = int(os.environ.get('SPECTRUM_CIRCUIT_BREAKER_COOLDOWN', 60))
+# retries of failed status codes allowed for each host in each window, see `retries.retry_request`
+RETRY_BUDGET = int(os.environ.get('SPECTRUM_RETRY_BUDGET', 30))
+RETRY_BUDGET_WINDOW = 60 # seconds
+
+class HostHealth: # pylint: disable=too-many-instance-attributes
+    def __init__(self, threshold, cooldown, retry_budget, retry_budget_window):
+        """Tracks the health of each host contacted by this process.
+
+        After `threshold` consecutive connection errors or 5xx responses the circuit of a host opens:
+        requests to it fail immediately with an UnrecoverableError for `cooldown` seconds,
+        after which a single request is let through to probe whether the host has recovered.
+        Independently, at most `retry_budget` retries are allowed for each host in any `retry_budget_window` seconds."""
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._retry_budget = retry_budget
+        self._retry_budget_window = retry_budget_window
+        self._lock = threading.Lock()
+        self._consecutive_failures = {}
+        self._opened_at = {}
+        self._retries = {}
+
+    def before_request(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return
+            if time.monotonic() - opened_at < self._cooldown:
+                raise UnrecoverableError(
+                    "Host %s is unavailable: %d consecutive connection errors or 5xx responses, failing fast for %s seconds (requested %s)"
+                    % (host, self._consecutive_failures[host], self._cooldown, url)
+                )
+            # half-open: let this request through, and keep others out until it has an outcome
+            self._opened_at[host] = time.monotonic()
+            LOGGER.info("Probing whether host %s has recovered", host)
+
+    def record_success(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host in self._opened_at:
+                LOGGER.info("Host %s has recovered", host)
+                del self._opened_at[host]
+            self._consecutive_failures[host] = 0
+
+    def record_failure(self, url, reason):
+        host = urlparse(url).netloc
+        with self._lock:
+            failures = self._consecutive_failures.get(host, 0) + 1
+            self._consecutive_failures[host] = failures
+            LOGGER.debug("Failure %d on host %s: %s", failures, host, reason)
+            if failures >= self._threshold:
+                if host not in self._opened_at:
+                    LOGGER.error("Host %s is failing (%s consecutive failures, last: %s), failing fast for %s seconds", host, failures, reason, self._cooldown)
+                self._opened_at[host] = time.monotonic()
+
+    def allow_retry(self, url):
+        "consumes one retry from the budget of the host, if there is any left"
+        host = urlparse(url).netloc
+        now = time.monotonic()
+        with self._lock:
+            retries = self._retries.setdefault(host, deque())
+            while retries and now - retries[0] > self._retry_budget_window:
+                retries.popleft()
+            if len(retries) >= self._retry_budget:
+                LOGGER.warning("Retry budget of host %s exhausted (%d retries in %s seconds), not retrying %s", host, len(retries), self._retry_budget_window, url)
+                return False
+            retries.append(now)
+            return True
+
+HOST_HEALTH = HostHealth(CIRCUIT_BREAKER_THRESHOLD, CIRCUIT_BREAKER_COOLDOWN, RETRY_BUDGET, RETRY_BUDGET_WINDOW)
+
+class _HealthTrackingSession(requests.Session):
+    def request(self, method, url, *args, **kwargs): # pylint: disable=arguments-differ
+        HOST_HEALTH.before_request(url)
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except ConnectionError as e:
+            HOST_HEALTH.record_failure(url, e)
+            raise
+        if response.status_code >= 500:
+            HOST_HEALTH.record_failure(url, "%s response" % response.status_code)
+        else:
+            HOST_HEALTH.record_success(url)
+        return response
+
+_SESSION = {'session': None, 'pid': None}
+_SESSION_LOCK = threading.Lock()
+
+def session():
+    "the `requests.Session` shared by the current process, created on first use (and again after a fork)"
+    with _SESSION_LOCK:
+        if _SESSION['session'] is None or _SESSION['pid'] != os.getpid():
+            _SESSION['session'] = _create_session()
+            _SESSION['pid'] = os.getpid()
+        return _SESSION['session']
+
+def _create_session():
+    LOGGER.debug("Creating HTTP session with %d pools of %d connections", POOL_CONNECTIONS, POOL_MAXSIZE)
+    new_session = _HealthTrackingSession()
+    # checks of unrelated hosts (journal, api, dashboard, CDN) must not send each other's cookies,
+    # nor follow paths that depend on a session: no cookie is ever accepted, as with bare `requests.get`
+    new_session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    # lsh@2023-07-26: iiif occasionally resets a network connection on initial/early requests. unsure why.
+    # `retries.retry_request` only handles status code failures and not network connection issues.
+    # - https://github.com/elifesciences/issues/issues/8422
+    # - https://urllib3.readthedocs.io/en/stable/user-guide.html#retrying-requests
+    # - https://urllib3.readthedocs.io/en/stable/reference/urllib3.util.html#urllib3.util.Retry
+    adapter = HTTPAdapter(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        max_retries=Retry(**{
+            'total': CONNECTION_RETRIES,
+            'connect': CONNECTION_RETRIES,
+            'read': CONNECTION_RETRIES,
+            # A set of integer HTTP status codes that we should force a retry on.
+            'status_forcelist': [], # disabled, allow `retries.retry_request` to handle these.
+            # {backoff factor} * (2 ** {number of previous retries})
+            # 0.3 => 0.3, 0.6, 1.2 seconds
+            'backoff_factor': 0.3,
+        })
+    )
+    new_session.mount('http://', adapter)
+    new_session.mount('https://', adapter)
+    return new_session
+
+def get(url, **kwargs):
+    return session().get(url, **kwargs)
+
+def head(url, **kwargs):
+    return session().head(url, **kwargs)
+
+def post(url, **kwargs):
+    return session().post(url, **kwargs)
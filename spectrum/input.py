@@ -11,10 +11,9 @@ import os
 import random
 import string
 import contextlib
-import requests
 from econtools import econ_workflow
 import mechanicalsoup
-from spectrum import aws, logger
+from spectrum import aws, http_client, logger
 from spectrum.config import SETTINGS
 
 
@@ -38,9 +37,14 @@ class InputBucket:
     def upload(self, filename, destination_filename=None, id=None):
         if not destination_filename:
             destination_filename = os.path.basename(filename)
-        self._s3.meta.client.upload_file(filename, self._bucket_name, destination_filename)
+        self._s3.meta.client.upload_file(filename, self._bucket_name, destination_filename, Config=aws.transfer_config())
         LOGGER.info("Uploaded %s to %s/%s", filename, self._bucket_name, destination_filename, extra={'id': id})
 
+    def upload_fileobj(self, fileobj, destination_filename, id=None):
+        "uploads the contents of a binary file object, e.g. a zip that was never written to disk"
+        self._s3.meta.client.upload_fileobj(fileobj, self._bucket_name, destination_filename, Config=aws.transfer_config())
+        LOGGER.info("Uploaded %s/%s", self._bucket_name, destination_filename, extra={'id': id})
+
     def clean(self, prefix=None):
         aws.clean_bucket(self._bucket_name, prefix)
 
@@ -57,7 +61,7 @@ class Dashboard:
         template = "%s/api/queue_article_publication"
         url = template % self._host
         body = {'articles': [{'id': id, 'version': version, 'run': run}]}
-        response = requests.post(url, auth=(self._user, self._password), json=body)
+        response = http_client.post(url, auth=(self._user, self._password), json=body)
         assert response.status_code == 200, ("Response status was %s: %s" % (response.status_code, response.text))
         LOGGER.info(
             "Pressed Publish for %s version %s run %s on dashboard",
@@ -344,7 +348,7 @@ class BioProtocol:
         # http://end2end--bp.elife.internal/bioprotocol/article/123456789
         template = "%s/bioprotocol/article/%s"
         url = template % (self.int_host, article_id)
-        response = requests.post(url, auth=(self.user, self.password), json=payload)
+        response = http_client.post(url, auth=(self.user, self.password), json=payload)
         assert response.status_code == 200, ("Response status was %s: %s" % (response.status_code, response.text))
 
 def invented_word(length=30, characters=None):
@@ -0,0 +1,60 @@
+"""utility library for sharing recent listings of S3 prefixes between checks polling the same bucket.
+
+contains no tests to be run."""
+
+from collections import OrderedDict
+import os
+import threading
+import time
+
+from spectrum import logger
+
+LOGGER = logger.logger(__name__)
+
+# seconds a listing can be served to other checks for
+LISTING_CACHE_TTL = float(os.environ.get('SPECTRUM_LISTING_CACHE_TTL', 5))
+# how many listings to keep, the least recently used are evicted first
+LISTING_CACHE_SIZE = int(os.environ.get('SPECTRUM_LISTING_CACHE_SIZE', 64))
+
+class ListingCache:
+    def __init__(self, ttl, size):
+        """Keeps the last `size` listings, each for `ttl` seconds.
+
+        A listing is only served to a caller if it was started after the caller's `not_before`,
+        so that objects written after that moment cannot be missing from it."""
+        self._ttl = ttl
+        self._size = size
+        self._lock = threading.Lock()
+        self._listings = OrderedDict()
+
+    def get(self, key, not_before=None):
+        "the listing cached for key, or None if there is none that is both fresh and recent enough"
+        with self._lock:
+            cached = self._listings.get(key)
+            if cached is None:
+                return None
+            started_at, listing = cached
+            if time.time() - started_at > self._ttl:
+                del self._listings[key]
+                return None
+            if not_before is not None and started_at <= not_before.timestamp():
+                return None
+            self._listings.move_to_end(key)
+            LOGGER.debug("Serving listing %s from %.1f seconds ago", key, time.time() - started_at)
+            return listing
+
+    def put(self, key, started_at, listing):
+        "started_at is when the listing was requested: objects written before then are in it"
+        if self._ttl <= 0:
+            return
+        with self._lock:
+            self._listings[key] = (started_at, listing)
+            self._listings.move_to_end(key)
+            while len(self._listings) > self._size:
+                self._listings.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+
+LISTING_CACHE = ListingCache(LISTING_CACHE_TTL, LISTING_CACHE_SIZE)
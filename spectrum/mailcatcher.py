@@ -1,6 +1,4 @@
-import requests
-
-from spectrum import logger, polling
+from spectrum import http_client, logger, polling
 
 LOGGER = logger.logger(__name__)
 
@@ -11,7 +9,7 @@ class MailcatcherCheck():
     def wait_email(self, subject):
         def _check():
             messages_url = "%s/messages" % self._url
-            messages = requests.get(messages_url).json()
+            messages = http_client.get(messages_url).json()
             matching = [m for m in messages if m['subject'] == subject]
             return (matching, messages)
 
@@ -0,0 +1,128 @@
+"""utility library describing the article templates in spectrum/templates, so that collection and generation
+don't have to scan the file system again for every article.
+
+contains no tests to be run."""
+
+import fnmatch
+import json
+import os
+from os import path
+import re
+import threading
+
+from spectrum import logger
+from spectrum.config import COMMON
+
+LOGGER = logger.logger(__name__)
+
+TEMPLATES_DIRECTORY = './spectrum/templates'
+TEMPLATE_PATTERN = re.compile(r'^elife-(\d+)-(vor|poa)-(r|v)\d+$')
+FIGURE_PATTERN = re.compile(r'^elife-\d+-(.+).tif$')
+# bump when the format of the entries changes, so that manifests written by older versions are ignored
+MANIFEST_VERSION = 2
+
+_MANIFEST = {'manifest': None}
+_MANIFEST_LOCK = threading.Lock()
+
+def templates():
+    """the article templates, sorted by name, each a dict of:
+
+    name, path, id, kind (vor or poa), figure_names, has_pdf,
+    files (static files, copied as they are), jinja (files rendered for each article) and bytes (the total size of the files)"""
+    return _manifest()['templates'] # pylint: disable=unsubscriptable-object
+
+def template(template_id):
+    "the single template of the article template_id"
+    found = [each for each in templates() if each['id'] == str(template_id)]
+    assert len(found) > 0, "No candidate templates found for: %s" % template_id
+    assert len(found) == 1, "Found multiple candidate templates: %s" % [each['path'] for each in found]
+    return found[0]
+
+def _manifest():
+    """the manifest of the current process, loaded on first use from COMMON['tmp'] or built if missing.
+
+    Rebuilt whenever the modification time of spectrum/templates, of any template in it or of any of their files has changed,
+    or the size of any of the files: when templates or files in them are added, removed, renamed or edited."""
+    with _MANIFEST_LOCK:
+        if _MANIFEST['manifest'] is None or not _is_fresh(_MANIFEST['manifest']):
+            manifest_filename = path.join(COMMON['tmp'], 'template-manifest.json')
+            manifest = _load(manifest_filename)
+            if manifest is None or not _is_fresh(manifest):
+                manifest = _build()
+                _save(manifest, manifest_filename)
+            _MANIFEST['manifest'] = manifest
+        return _MANIFEST['manifest']
+
+def _is_fresh(manifest):
+    return manifest.get('version') == MANIFEST_VERSION and manifest['stats'] == _stats(manifest['templates'])
+
+def _stats(entries):
+    """[modification time, size] of the templates directory, of each template of entries and of each of their files, None for missing ones.
+
+    Directories change when files are added, removed or renamed in them, files when they are edited in place"""
+    stats = {}
+    for entry in [TEMPLATES_DIRECTORY] + [each['path'] for each in entries] + [file for each in entries for file in each['files'] + each['jinja']]:
+        try:
+            stat = os.stat(entry)
+            stats[entry] = [stat.st_mtime_ns, stat.st_size]
+        except FileNotFoundError:
+            stats[entry] = None
+    return stats
+
+def _load(manifest_filename):
+    try:
+        with open(manifest_filename) as manifest_file:
+            return json.load(manifest_file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _save(manifest, manifest_filename):
+    os.makedirs(path.dirname(manifest_filename), exist_ok=True)
+    # other processes may be loading the same manifest, and must never see it half written
+    partial_manifest_filename = '%s.%s-%s.partial' % (manifest_filename, os.getpid(), threading.get_ident())
+    with open(partial_manifest_filename, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.replace(partial_manifest_filename, manifest_filename)
+
+def _build():
+    entries = []
+    for name in sorted(os.listdir(TEMPLATES_DIRECTORY)):
+        # like elife-xpub, not an article
+        if not fnmatch.fnmatch(name, 'elife-*-*-*'):
+            continue
+        match = TEMPLATE_PATTERN.match(name)
+        assert match is not None, ("Bad name for template directory %s" % name)
+        entries.append(_entry(name, match.group(1), match.group(2)))
+    LOGGER.info("Built manifest of %d templates", len(entries))
+    return {
+        'version': MANIFEST_VERSION,
+        'stats': _stats(entries),
+        'templates': entries,
+    }
+
+def _entry(name, template_id, kind):
+    template_path = '%s/%s' % (TEMPLATES_DIRECTORY, name)
+    files = []
+    jinja = []
+    total_bytes = 0
+    with os.scandir(template_path) as directory_entries:
+        for directory_entry in sorted(directory_entries, key=lambda each: each.name):
+            if directory_entry.name.startswith('.') or not directory_entry.is_file():
+                continue
+            total_bytes = total_bytes + directory_entry.stat().st_size
+            if directory_entry.name.endswith('.jinja'):
+                jinja.append(directory_entry.path)
+            else:
+                files.append(directory_entry.path)
+    figure_names = [match.group(1) for match in (FIGURE_PATTERN.match(path.basename(file)) for file in files) if match]
+    return {
+        'name': name,
+        'path': template_path,
+        'id': template_id,
+        'kind': kind,
+        'figure_names': figure_names,
+        'has_pdf': any(file.endswith('.pdf') for file in files),
+        'files': files,
+        'jinja': jinja,
+        'bytes': total_bytes,
+    }
@@ -0,0 +1,162 @@
+"""utility library for reading S3 `ObjectCreated` event notifications delivered to an SQS queue.
+
+contains no tests to be run."""
+
+from datetime import datetime, timezone
+import atexit
+import json
+import os
+from os import path
+import sqlite3
+import threading
+import time
+from urllib.parse import unquote_plus
+
+from spectrum import logger
+from spectrum.config import COMMON
+
+LOGGER = logger.logger(__name__)
+
+# long polling: SQS is asked on all of its servers, and answers as soon as a message is available
+RECEIVE_WAIT_SECONDS = 1
+# batches of 10 messages received in a row at most, before letting checks look at them
+RECEIVE_BATCHES = 10
+# seconds to wait for other processes holding the lock of the store
+BUSY_TIMEOUT = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS announcements (
+    bucket TEXT NOT NULL,
+    key TEXT NOT NULL,
+    event_time REAL NOT NULL,
+    PRIMARY KEY (bucket, key)
+);
+"""
+
+class BucketNotifications: # pylint: disable=too-many-instance-attributes
+    def __init__(self, sqs, queue_name, min_interval=1, retention=3600, filename=None):
+        """Remembers the keys announced as created on an SQS queue receiving S3 event notifications.
+
+        Messages are deleted from the queue as soon as their announcements are stored in the sqlite database `filename`,
+        shared by all processes on this machine (default `bucket-notifications.sqlite3` in COMMON['tmp']),
+        so that every xdist worker sees all of them even though each message is only received by one.
+        min_interval limits how often the queue is read, no matter how many checks are waiting.
+        retention is how long (in seconds) an announcement is remembered."""
+        self._sqs = sqs
+        self._queue_name = queue_name
+        self._queue_url = None
+        self._min_interval = min_interval
+        self._retention = retention
+        self._filename = filename
+        self._last_received = None
+        self._lock = threading.Lock()
+        self._connections = threading.local()
+        self._opened = []
+        atexit.register(self.close)
+
+    def find(self, bucket_name, pattern, last_modified_after=None):
+        """Returns (key, last_modified) of an object announced in bucket_name with a key matching the compiled `pattern`,
+        or None if no such object has been announced (yet)."""
+        self._receive()
+        try:
+            rows = self._connection().execute(
+                "SELECT key, event_time FROM announcements WHERE bucket = ? AND event_time > ? ORDER BY event_time DESC",
+                [bucket_name, last_modified_after.timestamp() if last_modified_after else 0]
+            ).fetchall()
+        except sqlite3.Error as e:
+            LOGGER.warning("Cannot read announcements from %s: %s", self._store_filename(), e)
+            return None
+        for key, event_time in rows:
+            if pattern.match(key):
+                return (key, datetime.fromtimestamp(event_time, timezone.utc))
+        return None
+
+    def _receive(self):
+        with self._lock:
+            now = time.time()
+            if self._last_received and now - self._last_received < self._min_interval:
+                return
+            self._last_received = now
+            if not self._queue_url:
+                self._queue_url = self._sqs.get_queue_url(QueueName=self._queue_name)['QueueUrl']
+            for _ in range(RECEIVE_BATCHES):
+                messages = self._sqs.receive_message(
+                    QueueUrl=self._queue_url,
+                    MaxNumberOfMessages=10,
+                    WaitTimeSeconds=RECEIVE_WAIT_SECONDS
+                ).get('Messages', [])
+                if not messages:
+                    break
+                events = [event for message in messages for event in object_created_events(message['Body'])]
+                if not self._store(events, now - self._retention):
+                    # left on the queue, to be received again once their visibility timeout expires
+                    break
+                self._sqs.delete_message_batch(
+                    QueueUrl=self._queue_url,
+                    Entries=[{'Id': str(index), 'ReceiptHandle': message['ReceiptHandle']} for index, message in enumerate(messages)]
+                )
+                if len(messages) < 10:
+                    break
+
+    def _store(self, events, forget_before):
+        "stores announcements of events, forgetting those older than forget_before; False if they could not be stored"
+        try:
+            with self._connection() as connection:
+                for bucket, key, event_time in events:
+                    connection.execute(
+                        "INSERT OR REPLACE INTO announcements (bucket, key, event_time) VALUES (?, ?, max(?, coalesce((SELECT event_time FROM announcements WHERE bucket = ? AND key = ?), 0)))",
+                        [bucket, key, event_time.timestamp(), bucket, key]
+                    )
+                connection.execute("DELETE FROM announcements WHERE event_time < ?", [forget_before])
+            return True
+        except sqlite3.Error as e:
+            LOGGER.warning("Cannot store announcements in %s: %s", self._store_filename(), e)
+            return False
+
+    def close(self):
+        "closes the connections to the store opened by this process"
+        with self._lock:
+            opened = [connection for (pid, connection) in self._opened if pid == os.getpid()]
+            self._opened = []
+        for connection in opened:
+            connection.close()
+        self._connections = threading.local()
+
+    def _store_filename(self):
+        return self._filename or path.join(COMMON['tmp'], 'bucket-notifications.sqlite3')
+
+    def _connection(self):
+        "a connection for the current thread, as sqlite connections cannot be shared between threads, nor survive a fork"
+        if getattr(self._connections, 'pid', None) != os.getpid():
+            filename = self._store_filename()
+            os.makedirs(path.dirname(path.abspath(filename)), exist_ok=True)
+            connection = sqlite3.connect(filename, timeout=BUSY_TIMEOUT)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+            self._connections.connection = connection
+            self._connections.pid = os.getpid()
+            self._opened.append((os.getpid(), connection))
+        return self._connections.connection
+
+def object_created_events(body):
+    """Extracts (bucket, key, event_time) tuples from the body of an S3 event notification message.
+
+    Supports messages delivered directly from S3 and wrapped in an SNS notification; test events are ignored."""
+    try:
+        notification = json.loads(body)
+        if 'Records' not in notification and 'Message' in notification:
+            notification = json.loads(notification['Message'])
+    except ValueError:
+        LOGGER.warning("Cannot parse S3 event notification: %s", body)
+        return []
+    events = []
+    for record in notification.get('Records', []):
+        if not record.get('eventName', '').startswith('ObjectCreated:'):
+            continue
+        event_time = datetime.strptime(record['eventTime'], '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc)
+        events.append((
+            record['s3']['bucket']['name'],
+            unquote_plus(record['s3']['object']['key']),
+            event_time
+        ))
+    return events
@@ -3,22 +3,88 @@
 contains no tests to be run."""
 
 from __future__ import absolute_import
+import contextlib
+import contextvars
 import os
 from pprint import pformat
+import random
+import time
 from urllib.parse import urlparse
 
 import polling
 from requests.exceptions import ConnectionError
 
-from spectrum import debug
+from spectrum import debug, telemetry
 from spectrum.exceptions import TimeoutError
 
 
 GLOBAL_TIMEOUT = int(os.environ['SPECTRUM_TIMEOUT']) if 'SPECTRUM_TIMEOUT' in os.environ else 600
+# budget for all the polls of a single test, see `deadline()`
+TEST_DEADLINE = int(os.environ['SPECTRUM_TEST_DEADLINE']) if 'SPECTRUM_TEST_DEADLINE' in os.environ else 3 * GLOBAL_TIMEOUT
+# budget for tests publishing an article more than once, e.g. a new version or a silent correction
+CHAINED_TEST_DEADLINE = 2 * TEST_DEADLINE
 
-def poll(action_fn, error_message, *error_message_args):
+_DEADLINE = contextvars.ContextVar('deadline', default=None)
+
+class PollingProfile:
+    def __init__(self, name, initial, factor, cap, jitter=0.2, timeout=None):
+        """Describes how often and for how long to poll.
+
+        The first wait is `initial` seconds, and every following wait is `factor` times the previous one up to `cap` seconds.
+        Waits at the cap are randomly shortened by up to `jitter` (a fraction of `cap`) so that parallel workers don't poll in lockstep.
+        timeout defaults to GLOBAL_TIMEOUT."""
+        assert initial > 0, "The initial interval of %s must be positive: %s" % (name, initial)
+        assert factor >= 1, "The growth factor of %s must be at least 1: %s" % (name, factor)
+        assert cap >= initial, "The cap of %s must be at least the initial interval: %s < %s" % (name, cap, initial)
+        self.name = name
+        self.initial = initial
+        self.factor = factor
+        self.cap = cap
+        self.jitter = jitter
+        self.timeout = timeout if timeout is not None else GLOBAL_TIMEOUT
+
+    def next_step(self, step):
+        next_step = step * self.factor
+        if next_step < self.cap:
+            return next_step
+        return self.cap * (1 - random.uniform(0, self.jitter))
+
+    def __str__(self):
+        return "PollingProfile(%s)" % self.name
+
+# services answering quickly and cheaply, where content is usually there after a few seconds
+FAST = PollingProfile('fast', initial=0.5, factor=1.5, cap=5)
+DEFAULT = PollingProfile('default', initial=1, factor=1.5, cap=10)
+# expensive checks (large listings, downloads) or slow pipelines (archiving, third parties)
+SLOW = PollingProfile('slow', initial=5, factor=2, cap=30)
+
+PROFILES = {profile.name: profile for profile in [FAST, DEFAULT, SLOW]}
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """Within this context, every poll gives up at the latest `seconds` from now.
+
+    Nested deadlines can only shorten the budget, never extend it."""
+    absolute_deadline = time.time() + seconds
+    enclosing_deadline = _DEADLINE.get()
+    if enclosing_deadline is not None:
+        absolute_deadline = min(absolute_deadline, enclosing_deadline)
+    token = _DEADLINE.set(absolute_deadline)
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(token)
+
+def remaining_budget():
+    "seconds left before the current deadline, or None if there isn't one"
+    absolute_deadline = _DEADLINE.get()
+    if absolute_deadline is None:
+        return None
+    return absolute_deadline - time.time()
+
+def poll(action_fn, error_message, *error_message_args, profile=DEFAULT):
     """
-    Poll until action_fn returns something truthy. After GLOBAL_TIMEOUT throw an exception.
+    Poll until action_fn returns something truthy. After profile.timeout throw an exception.
 
     action_fn may return:
     - a tuple: first element is a result (truthy or falsy), second element any detail
@@ -26,32 +92,84 @@ def poll(action_fn, error_message, *error_message_args):
 
     error_message may be:
     - a string to be formatted with error_message_args
-    - a callable returning such a string"""
-    details = {'last_seen': None}
+    - a callable returning such a string
+
+    profile is a PollingProfile deciding the interval between attempts and the timeout,
+    though the timeout is shortened to the remaining budget when inside a `deadline()`
+
+    Every poll is recorded through spectrum.telemetry."""
+    details = {'last_seen': None, 'attempts': 0}
     def wrapped_action_fn():
+        details['attempts'] = details['attempts'] + 1
         possible_result = action_fn()
         if isinstance(possible_result, tuple) and len(possible_result) == 2:
             details['last_seen'] = possible_result[1]
             return possible_result[0]
         return possible_result
 
-    timeout = GLOBAL_TIMEOUT
+    def _record(outcome, target):
+        telemetry.record_poll(
+            _check_name(action_fn),
+            target,
+            details['attempts'],
+            time.monotonic() - started,
+            outcome,
+            details['last_seen']
+        )
+
+    timeout = profile.timeout
+    budget = remaining_budget()
+    limited_by_deadline = budget is not None and budget < timeout
+    if limited_by_deadline:
+        timeout = budget
+    started = time.monotonic()
+    if timeout <= 0:
+        built_error_message = _target(error_message, error_message_args)
+        _record('timeout', built_error_message)
+        raise TimeoutError.giving_up_on(built_error_message + "\nThe deadline of this test has already passed", 0)
     try:
-        return polling.poll(
+        result = polling.poll(
             wrapped_action_fn,
             timeout=timeout,
-            step=5
+            step=profile.initial,
+            step_function=profile.next_step
         )
+        _record('success', _cheap_target(error_message, error_message_args))
+        return result
     except polling.TimeoutException as exc:
-        if callable(error_message):
-            error_message_template = error_message()
-        else:
-            error_message_template = error_message
-        built_error_message = error_message_template % tuple(error_message_args)
+        built_error_message = _target(error_message, error_message_args)
+        _record('timeout', built_error_message)
         if 'last_seen' in details:
             built_error_message = built_error_message + "\n" + pformat(details['last_seen'])
             if isinstance(details['last_seen'], ConnectionError):
                 host = urlparse(details['last_seen'].request.url).netloc
                 built_error_message = built_error_message + ("\nHost: %s" % host)
                 built_error_message = built_error_message + ("\nIp: %s" % debug.get_host_ip(host))
+        if limited_by_deadline:
+            built_error_message = built_error_message + "\nTimeout shortened by the deadline of this test"
         raise TimeoutError.giving_up_on(built_error_message, timeout) from exc
+    except Exception:
+        _record('error', _cheap_target(error_message, error_message_args))
+        raise
+
+def _target(error_message, error_message_args):
+    if callable(error_message):
+        error_message_template = error_message()
+    else:
+        error_message_template = error_message
+    return error_message_template % tuple(error_message_args)
+
+def _cheap_target(error_message, error_message_args):
+    """what was waited for, without building the error message: callable ones are only invoked once a poll has failed,
+    as they may be expensive or raise"""
+    if callable(error_message):
+        return " ".join(str(each) for each in error_message_args) or None
+    try:
+        return error_message % tuple(error_message_args)
+    except (TypeError, ValueError):
+        return error_message
+
+def _check_name(action_fn):
+    "e.g. `ApiCheck.wait_article` for a function defined inside that method"
+    qualified_name = getattr(action_fn, '__qualname__', repr(action_fn))
+    return qualified_name.rsplit('.<locals>', 1)[0]
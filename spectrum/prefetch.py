@@ -0,0 +1,49 @@
+"""utility library for generating articles in the background, before the tests that need them start.
+
+contains no tests to be run."""
+
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from spectrum import generator, logger
+
+LOGGER = logger.logger(__name__)
+
+class ArticlePrefetcher:
+    def __init__(self, workers):
+        """Generates articles from templates on `workers` background threads.
+
+        Threads rather than processes, as an ArticleZip holds an open file.
+        Articles are generated with a random id and no template variables, like `generator.article_zip(template_id)`."""
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        self._ready = defaultdict(deque)
+
+    def prefetch(self, template_ids):
+        "makes sure an article is being generated for each of template_ids, counting repetitions"
+        with self._lock:
+            for template_id, needed in Counter(str(each) for each in template_ids).items():
+                for _ in range(needed - len(self._ready[template_id])):
+                    LOGGER.debug("Prefetching an article from template %s", template_id)
+                    self._ready[template_id].append(self._executor.submit(generator.article_zip, template_id))
+
+    def take(self, template_id):
+        "an article generated in the background from template_id, waiting for it if necessary; None if none was prefetched"
+        with self._lock:
+            ready = self._ready[str(template_id)]
+            future = ready.popleft() if ready else None
+        if future is None:
+            return None
+        return future.result()
+
+    def close(self):
+        "waits for the articles being generated, and cleans all those that were not taken"
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            leftovers = [future for ready in self._ready.values() for future in ready]
+            self._ready.clear()
+        for future in leftovers:
+            if future.exception() is None:
+                future.result().clean()
+        LOGGER.info("Cleaned %d prefetched articles that were not used", len(leftovers))
@@ -0,0 +1,144 @@
+"""utility library for remembering which resources of pages (scripts, stylesheets, fonts, images) were already loaded successfully,
+shared between all processes running tests or load on this machine.
+
+contains no tests to be run."""
+
+import atexit
+import os
+from os import path
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from spectrum import logger
+from spectrum.config import COMMON
+
+LOGGER = logger.logger(__name__)
+
+# seconds a resource that loaded successfully is not checked again for
+RESOURCE_CACHE_TTL = float(os.environ.get('SPECTRUM_RESOURCE_CACHE_TTL', 600))
+# seconds for resources with a content hash in their path, which never change
+RESOURCE_CACHE_IMMUTABLE_TTL = float(os.environ.get('SPECTRUM_RESOURCE_CACHE_IMMUTABLE_TTL', 86400))
+# how many resources to remember, the least recently used are evicted first
+RESOURCE_CACHE_SIZE = int(os.environ.get('SPECTRUM_RESOURCE_CACHE_SIZE', 10000))
+# e.g. /assets/patterns/css/all.5f3a9b2c.css or /assets/5f3a9b2c0d1e/app.js,
+# with at least one letter so that article ids like /iiif/2/elife-12300625-fig1/... are not mistaken for one
+FINGERPRINT = re.compile(r'[./_-](?=[0-9]*[a-f])[0-9a-f]{8,}[./_-]')
+# seconds to wait for other processes holding the lock of the database
+BUSY_TIMEOUT = 30
+# last_used is only written again once it is this old, so that hits don't all contend for the lock
+LAST_USED_RESOLUTION = 60
+# urls looked up in a single query, below the limit of older sqlite versions
+MAX_VARIABLES = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    method TEXT NOT NULL,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (method, url)
+);
+CREATE INDEX IF NOT EXISTS resources_last_used ON resources (last_used);
+"""
+
+class ResourceCache:
+    def __init__(self, filename, ttl, immutable_ttl, size):
+        """Remembers the status of resources that loaded successfully in the sqlite database `filename`, created on first use,
+        for `ttl` seconds or `immutable_ttl` seconds for fingerprinted resources, keeping at most `size` of them.
+
+        The database is in WAL mode, so that many processes can read it while one writes to it.
+        Errors of the database are logged and the cache behaves as if it were empty: they never fail a check."""
+        self._filename = filename
+        self._ttl = ttl
+        self._immutable_ttl = immutable_ttl
+        self._size = size
+        self._lock = threading.Lock()
+        self._connections = threading.local()
+        self._opened = []
+        atexit.register(self.close)
+
+    def get_many(self, method, urls):
+        "the status of each of urls, a list, that is cached for method, as a dict"
+        if not urls:
+            return {}
+        now = time.time()
+        rows = []
+        try:
+            connection = self._connection()
+            for start in range(0, len(urls), MAX_VARIABLES):
+                chunk = list(urls[start:start + MAX_VARIABLES])
+                rows.extend(connection.execute(
+                    "SELECT url, status, last_used FROM resources WHERE method = ? AND expires_at > ? AND url IN (%s)" % ','.join('?' * len(chunk)),
+                    [method, now] + chunk
+                ).fetchall())
+            stale = [(now, method, url) for (url, _, last_used) in rows if now - last_used > LAST_USED_RESOLUTION]
+            if stale:
+                with connection:
+                    connection.executemany("UPDATE resources SET last_used = ? WHERE method = ? AND url = ?", stale)
+        except sqlite3.Error as e:
+            LOGGER.warning("Cannot read resource cache %s: %s", self._filename, e)
+            return {}
+        return {url: status for (url, status, _) in rows}
+
+    def put_many(self, method, statuses):
+        "remembers statuses, a dict of url to status code, for method, evicting the least recently used resources if necessary"
+        if not statuses:
+            return
+        now = time.time()
+        entries = [(method, url, status, now + self._ttl_of(url), now) for (url, status) in statuses.items()]
+        try:
+            connection = self._connection()
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO resources (method, url, status, expires_at, last_used) VALUES (?, ?, ?, ?, ?)", entries)
+                connection.execute("DELETE FROM resources WHERE expires_at <= ?", [now])
+                evicted = connection.execute(
+                    "DELETE FROM resources WHERE (method, url) IN (SELECT method, url FROM resources ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    [self._size]
+                ).rowcount
+            if evicted:
+                LOGGER.debug("Evicted %d resources from %s", evicted, self._filename)
+        except sqlite3.Error as e:
+            LOGGER.warning("Cannot write resource cache %s: %s", self._filename, e)
+
+    def clear(self):
+        try:
+            with self._connection() as connection:
+                connection.execute("DELETE FROM resources")
+        except sqlite3.Error as e:
+            LOGGER.warning("Cannot clear resource cache %s: %s", self._filename, e)
+
+    def close(self):
+        "closes the connections to the database opened by this process, at exit or at the end of a test session"
+        with self._lock:
+            (closing, self._opened) = ([each for each in self._opened if each[0] == os.getpid()], [])
+        for (_, connection) in closing:
+            connection.close()
+        self._connections = threading.local()
+
+    def _ttl_of(self, url):
+        return self._immutable_ttl if FINGERPRINT.search(urlparse(url).path) else self._ttl
+
+    def _connection(self):
+        "a connection for the current thread, as sqlite connections cannot be shared between threads, nor survive a fork"
+        if getattr(self._connections, 'pid', None) != os.getpid():
+            os.makedirs(path.dirname(path.abspath(self._filename)), exist_ok=True)
+            connection = sqlite3.connect(self._filename, timeout=BUSY_TIMEOUT)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(_SCHEMA)
+            self._connections.connection = connection
+            self._connections.pid = os.getpid()
+            with self._lock:
+                self._opened.append((os.getpid(), connection))
+        return self._connections.connection
+
+RESOURCE_CACHE = ResourceCache(
+    os.environ.get('SPECTRUM_RESOURCE_CACHE', path.join(COMMON['tmp'], 'resources.sqlite3')),
+    RESOURCE_CACHE_TTL,
+    RESOURCE_CACHE_IMMUTABLE_TTL,
+    RESOURCE_CACHE_SIZE
+)
@@ -3,8 +3,7 @@
 contains no tests that are run."""
 
 import backoff
-import requests
-from spectrum import logger
+from spectrum import http_client, logger
 
 LOGGER = logger.logger(__name__)
 
@@ -21,7 +20,8 @@ def retry_request(response):
         502,
         504
     ]
-    return response.status_code in retry_these
+    # every host has a limited budget of retries, so that an incident isn't made worse by everyone retrying
+    return response.status_code in retry_these and http_client.HOST_HEALTH.allow_retry(response.url)
 
 
 def _retrying_request(details):
@@ -32,4 +32,4 @@ def _retrying_request(details):
 # timeouts will cut it (a CDN may serve a stale version if it has it)
 @backoff.on_predicate(backoff.expo, predicate=retry_request, max_tries=MAX_RETRIES, on_backoff=_retrying_request)
 def persistently_get(url, **kwargs):
-    return requests.get(url, **kwargs)
+    return http_client.get(url, **kwargs)
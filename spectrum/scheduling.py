@@ -0,0 +1,132 @@
+"""utility library for distributing tests across xdist workers longest first,
+so that long tests such as the kitchen sink don't start last while other workers sit idle.
+
+contains no tests to be run."""
+
+import re
+import statistics
+from xml.etree import ElementTree
+
+from xdist.scheduler import LoadScheduling
+
+from spectrum import logger, manifest
+
+LOGGER = logger.logger(__name__)
+
+# durations of the tests of the previous run, see reset-build.sh: not *.xml, so that it is never reported again as a result of the current run
+PREVIOUS_JUNIT = 'build/junit.xml.previous'
+# estimated duration of a test of an article template never run before, before scaling by the previous run
+TEMPLATE_SECONDS = 60
+TEMPLATE_SECONDS_PER_MEGABYTE = 10
+# tests each worker is given at a time: a worker needs to know the test after the one it is running
+PENDING_PER_NODE = 2
+# members of xdist's LoadScheduling used here that are not part of its public API, why pytest-xdist is pinned exactly in Pipfile
+XDIST_INTERNALS = ['_check_nodes_have_same_collection', '_send_tests', 'collection', 'node2collection', 'node2pending', 'pending']
+
+class LongestFirstScheduling(LoadScheduling): # pylint: disable=abstract-method
+    def __init__(self, config, log=None, junit_filename=PREVIOUS_JUNIT):
+        """Like `--dist load`, but sends the tests expected to take the longest first.
+
+        Each worker is only ever given PENDING_PER_NODE tests, and the next longest test goes to the first worker
+        that finishes one, rather than sending chunks of consecutive tests to each worker."""
+        super().__init__(config, log)
+        self._junit_filename = junit_filename
+
+    def schedule(self):
+        assert self.collection_is_completed
+
+        # initial distribution already happened, reschedule on all nodes
+        if self.collection is not None:
+            for node in self.nodes:
+                self.check_schedule(node)
+            return
+
+        if not self._check_nodes_have_same_collection():
+            self.log("**Different tests collected, aborting run**")
+            return
+
+        self.collection = next(iter(self.node2collection.values()))
+        estimates = estimated_durations(self.collection, previous_durations(self._junit_filename))
+        # sorted() is stable: tests with the same estimate keep the order of the collection
+        self.pending[:] = sorted(range(len(self.collection)), key=lambda index: estimates[index], reverse=True)
+        if not self.collection:
+            return
+        LOGGER.info("Scheduling %d tests longest first, estimated %.0f seconds in total", len(self.collection), sum(estimates))
+
+        for _ in range(PENDING_PER_NODE):
+            for node in self.nodes:
+                self._send_tests(node, 1)
+
+        if not self.pending:
+            for node in self.nodes:
+                node.shutdown()
+
+    def check_schedule(self, node, duration=0):
+        if node.shutting_down:
+            return
+        if self.pending:
+            missing = PENDING_PER_NODE - len(self.node2pending[node])
+            if missing > 0:
+                self._send_tests(node, missing)
+        else:
+            node.shutdown()
+        self.log("num items waiting for node:", len(self.pending))
+
+def previous_durations(junit_filename):
+    "seconds taken by each test of a junit xml report, by node id; empty if there is no report"
+    try:
+        tree = ElementTree.parse(junit_filename)
+    except (FileNotFoundError, ElementTree.ParseError) as e:
+        LOGGER.info("No previous durations from %s: %s", junit_filename, e)
+        return {}
+    durations = {}
+    for testcase in tree.iter('testcase'):
+        key = (testcase.get('classname', ''), testcase.get('name', ''))
+        durations[key] = float(testcase.get('time', 0))
+    return durations
+
+def estimated_durations(nodeids, durations):
+    """the estimated seconds each of nodeids will take, in the same order.
+
+    Tests run before take as long as they did then, durations being what `previous_durations` returns.
+    Tests of an article template never run before are estimated from the size of the template,
+    scaled by how long the other tests of templates took compared to their own estimate.
+    Any other test is estimated to take the median of the previous durations."""
+    sizes = {template['id']: template['bytes'] for template in manifest.templates()}
+    template_estimates = [_template_estimate(nodeid, sizes) for nodeid in nodeids]
+    previous = [durations.get(_junit_key(nodeid)) for nodeid in nodeids]
+
+    ratios = []
+    for ((_, name), seconds) in durations.items():
+        previous_estimate = _template_estimate(name, sizes)
+        if previous_estimate:
+            ratios.append(seconds / previous_estimate)
+    scale = statistics.median(ratios) if ratios else 1
+    default = statistics.median(durations.values()) if durations else 0
+
+    estimates = []
+    for (seconds, template_estimate) in zip(previous, template_estimates):
+        if seconds is not None:
+            estimates.append(seconds)
+        elif template_estimate is not None:
+            estimates.append(template_estimate * scale)
+        else:
+            estimates.append(default)
+    return estimates
+
+def _template_estimate(test, sizes):
+    "estimated seconds for a test, node id or name, with an article template id as one of its parameters, None for other tests"
+    match = re.search(r'\[(.+)\]$', test)
+    if not match:
+        return None
+    for parameter in match.group(1).split('-'):
+        if parameter in sizes:
+            return TEMPLATE_SECONDS + TEMPLATE_SECONDS_PER_MEGABYTE * sizes[parameter] / (1024 * 1024)
+    return None
+
+def _junit_key(nodeid):
+    """the (classname, name) of a test in a junit xml report, e.g.
+    spectrum/test_article.py::test_article_first_version[15893] is ('spectrum.test_article', 'test_article_first_version[15893]')"""
+    parts = nodeid.split('::')
+    module = re.sub(r'\.py$', '', parts[0]).replace('/', '.')
+    return ('.'.join([module] + parts[1:-1]), parts[-1])
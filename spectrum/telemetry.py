@@ -0,0 +1,78 @@
+"""utility library for recording every poll as a line of JSON in build/polls.jsonl, and summarizing them.
+
+contains no tests to be run."""
+
+from collections import defaultdict
+from datetime import datetime
+import json
+import os
+from os import path
+from pprint import pformat
+
+from spectrum import logger
+
+LOGGER = logger.logger(__name__)
+
+# in the build folder of the project, wherever pytest is run from
+POLLS_FILENAME = path.join(path.dirname(path.dirname(path.abspath(__file__))), 'build', 'polls.jsonl')
+
+def record_poll(check, target, attempts, duration, outcome, last_seen=None):
+    """Appends a record of a completed poll.
+
+    check is the kind of check, e.g. `BucketFileCheck.of`; target what was waited for.
+    outcome is one of 'success', 'timeout' or 'error'."""
+    record = {
+        'check': check,
+        'target': target,
+        'attempts': attempts,
+        'duration': round(duration, 3),
+        'outcome': outcome,
+        'last_seen_size': len(pformat(last_seen)) if last_seen is not None else 0,
+        'test': os.environ.get('PYTEST_CURRENT_TEST'),
+        'worker': os.environ.get('PYTEST_XDIST_WORKER'),
+        'finished_at': datetime.now().isoformat(),
+    }
+    try:
+        # a single write of a single line, so that concurrent workers appending don't interleave
+        with open(POLLS_FILENAME, 'a') as polls_file:
+            polls_file.write(json.dumps(record) + "\n")
+    except OSError as e:
+        LOGGER.warning("Cannot record poll in %s: %s", POLLS_FILENAME, e)
+
+def read_polls(filename=POLLS_FILENAME):
+    if not os.path.exists(filename):
+        return []
+    polls = []
+    with open(filename) as polls_file:
+        for line in polls_file:
+            if line.strip():
+                polls.append(json.loads(line))
+    return polls
+
+def slowest(polls, limit=10):
+    return sorted(polls, key=lambda poll: poll['duration'], reverse=True)[0:limit]
+
+def by_check(polls):
+    "aggregates polls per check, sorted by total time spent waiting"
+    totals = defaultdict(lambda: {'polls': 0, 'attempts': 0, 'duration': 0.0, 'max_duration': 0.0, 'failures': 0})
+    for poll in polls:
+        total = totals[poll['check']]
+        total['polls'] = total['polls'] + 1
+        total['attempts'] = total['attempts'] + poll['attempts']
+        total['duration'] = total['duration'] + poll['duration']
+        total['max_duration'] = max(total['max_duration'], poll['duration'])
+        if poll['outcome'] != 'success':
+            total['failures'] = total['failures'] + 1
+    return sorted(totals.items(), key=lambda item: item[1]['duration'], reverse=True)
+
+def summary_lines(polls, limit=10):
+    lines = ["%d polls recorded in %s" % (len(polls), POLLS_FILENAME)]
+    lines.append("Slowest polls:")
+    lines.append("%9s %8s %-8s %-40s %s" % ('seconds', 'attempts', 'outcome', 'check', 'target'))
+    for poll in slowest(polls, limit):
+        lines.append("%9.1f %8d %-8s %-40s %s" % (poll['duration'], poll['attempts'], poll['outcome'], poll['check'], poll['target']))
+    lines.append("Time spent polling by check:")
+    lines.append("%9s %8s %8s %9s %8s %s" % ('seconds', 'polls', 'attempts', 'max', 'failures', 'check'))
+    for check, total in by_check(polls):
+        lines.append("%9.1f %8d %8d %9.1f %8d %s" % (total['duration'], total['polls'], total['attempts'], total['max_duration'], total['failures'], check))
+    return lines
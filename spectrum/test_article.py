@@ -11,6 +11,7 @@ from spectrum import articles
 from spectrum import generator
 from spectrum import input
 from spectrum import checks
+from spectrum import polling
 
 SIMPLEST_ARTICLE_ID = 15893
 KITCHEN_SINK_ARTICLE_ID = '1234567890'
@@ -77,6 +78,7 @@ def test_package_poa(poa_csvs, poa_zip):
 @pytest.mark.continuum
 @pytest.mark.bot
 @pytest.mark.lax
+@pytest.mark.deadline(polling.CHAINED_TEST_DEADLINE)
 def test_article_multiple_ingests_of_the_same_version(generate_article, modify_article):
     run1_start = datetime.now()
     article = generate_article(SIMPLEST_ARTICLE_ID)
@@ -99,6 +101,7 @@ def test_article_multiple_ingests_of_the_same_version(generate_article, modify_a
 @pytest.mark.metrics
 @pytest.mark.bot
 @pytest.mark.lax
+@pytest.mark.deadline(polling.CHAINED_TEST_DEADLINE)
 def test_article_multiple_versions(generate_article, modify_article):
     article = generate_article(SIMPLEST_ARTICLE_ID)
     _ingest_and_publish_and_wait_for_published(article)
@@ -120,6 +123,7 @@ def test_article_multiple_versions(generate_article, modify_article):
 @pytest.mark.continuum
 @pytest.mark.bot
 @pytest.mark.lax
+@pytest.mark.deadline(polling.CHAINED_TEST_DEADLINE)
 def test_article_silent_correction(generate_article, modify_article):
     article = generate_article(SIMPLEST_ARTICLE_ID)
     _ingest_and_publish_and_wait_for_published(article)
@@ -140,6 +144,7 @@ def test_article_silent_correction(generate_article, modify_article):
 @pytest.mark.continuum
 @pytest.mark.bot
 @pytest.mark.lax
+@pytest.mark.deadline(polling.CHAINED_TEST_DEADLINE)
 def test_article_subject_change(generate_article):
     article = generate_article(SIMPLEST_ARTICLE_ID)
     _ingest_and_publish_and_wait_for_published(article)
@@ -156,6 +161,7 @@ def test_article_subject_change(generate_article):
 @pytest.mark.continuum
 @pytest.mark.bot
 @pytest.mark.lax
+@pytest.mark.deadline(polling.CHAINED_TEST_DEADLINE)
 def test_article_already_present_version(generate_article, version_article):
     article = generate_article(SIMPLEST_ARTICLE_ID)
     _ingest_and_publish_and_wait_for_published(article)
@@ -219,6 +225,7 @@ def test_searching_for_a_new_article(generate_article, modify_article):
 @pytest.mark.journal
 @pytest.mark.recommendations
 @pytest.mark.lax
+@pytest.mark.deadline(polling.CHAINED_TEST_DEADLINE)
 def test_recommendations_for_new_articles(generate_article):
     template_id = '06847'
     related_template_id = '22661'
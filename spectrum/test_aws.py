@@ -0,0 +1,48 @@
+from unittest import mock
+from botocore.exceptions import ClientError
+import pytest
+from . import aws
+
+moto = pytest.importorskip('moto')
+boto3 = pytest.importorskip('boto3')
+
+@pytest.fixture(name='s3')
+def _s3(monkeypatch):
+    with moto.mock_aws():
+        s3 = boto3.resource('s3', region_name='us-east-1')
+        monkeypatch.setattr(aws, 'S3', s3)
+        yield s3
+
+def test_clean_bucket_deletes_in_parallel_batches(s3, monkeypatch):
+    monkeypatch.setattr(aws, 'DELETE_BATCH_SIZE', 10)
+    monkeypatch.setattr(aws, 'DELETE_CONCURRENCY', 2)
+    bucket = s3.create_bucket(Bucket='end2end-input')
+    for i in range(55):
+        bucket.put_object(Key='articles/%d.zip' % i, Body=b'')
+    bucket.put_object(Key='digests/1.zip', Body=b'')
+
+    deleted, errors = aws.clean_bucket('end2end-input', prefix='articles/')
+
+    assert deleted == 55
+    assert not errors
+    assert [each.key for each in bucket.objects.all()] == ['digests/1.zip']
+
+def test_clean_workflows_terminates_every_page_of_open_executions(monkeypatch):
+    pages = [
+        {'executionInfos': [_execution('1'), _execution('2')], 'nextPageToken': 'page-2'},
+        {'executionInfos': [_execution('3'), _execution('closed')]},
+    ]
+    swf = mock.Mock()
+    swf.list_open_workflow_executions.side_effect = pages
+    def terminate_workflow_execution(**kwargs):
+        if kwargs['workflowId'] == 'closed':
+            raise ClientError({'Error': {'Code': 'UnknownResourceFault', 'Message': 'closed'}}, 'TerminateWorkflowExecution')
+    swf.terminate_workflow_execution.side_effect = terminate_workflow_execution
+    monkeypatch.setattr(aws, 'SWF', swf)
+    monkeypatch.setattr(aws, 'TERMINATE_RATE', 1000)
+
+    assert aws.clean_workflows(window_hours=2) == {'terminated': 3, 'failed': 0, 'skipped': 1}
+    assert swf.list_open_workflow_executions.call_args_list[1][1]['nextPageToken'] == 'page-2'
+
+def _execution(workflow_id):
+    return {'execution': {'workflowId': workflow_id, 'runId': 'run-%s' % workflow_id}}
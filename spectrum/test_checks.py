@@ -0,0 +1,210 @@
+# pylint: disable=protected-access
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import threading
+import time
+from unittest import mock
+import pytest
+from . import checks, http_client, listings, polling
+from .exceptions import TimeoutError
+
+moto = pytest.importorskip('moto')
+boto3 = pytest.importorskip('boto3')
+botocore_exceptions = pytest.importorskip('botocore.exceptions')
+
+QUICK = polling.PollingProfile('quick', initial=0.01, factor=1, cap=0.01, timeout=0.2)
+
+pytestmark = pytest.mark.usefixtures('polls_filename')
+
+@pytest.fixture(name='published_bucket')
+def _published_bucket():
+    listings.LISTING_CACHE.clear()
+    with moto.mock_aws():
+        s3 = boto3.resource('s3', region_name='us-east-1')
+        bucket = s3.create_bucket(Bucket='published')
+        yield s3, bucket
+
+def test_all_of_resolves_every_key_with_one_listing_per_attempt(published_bucket):
+    s3, bucket = published_bucket
+    for key in ['articles/1234/elife-1234-fig1-v1.jpg', 'articles/1234/elife-1234-fig2-v1.jpg', 'articles/1234/elife-1234-v1.xml']:
+        bucket.put_object(Key=key, Body=b'')
+    check = checks.BucketFileCheck(s3, 'published', 'articles/{id}/', 'articles/{id}/', polling_profile=QUICK)
+    expected = [
+        r'articles/1234/elife-1234-v1\.xml',
+        r'articles/1234/elife-1234-fig2-v1\.jpg',
+        r'articles/1234/elife-1234-fig1-v1\.jpg',
+    ]
+    assert check.all_of(expected, id='1234') == [
+        'articles/1234/elife-1234-v1.xml',
+        'articles/1234/elife-1234-fig2-v1.jpg',
+        'articles/1234/elife-1234-fig1-v1.jpg',
+    ]
+
+def test_all_of_reports_the_missing_keys(published_bucket):
+    s3, bucket = published_bucket
+    bucket.put_object(Key='articles/1234/elife-1234-v1.xml', Body=b'')
+    check = checks.BucketFileCheck(s3, 'published', 'articles/{id}/', 'articles/{id}/', polling_profile=QUICK)
+    with pytest.raises(TimeoutError) as exc_info:
+        check.all_of([r'articles/1234/elife-1234-v1\.xml', r'articles/1234/elife-1234-v1\.pdf'], id='1234')
+    assert r"'missing': ['articles/1234/elife-1234-v1\\.pdf']" in str(exc_info.value)
+
+def test_literal_keys_are_looked_up_without_listing(published_bucket):
+    s3, bucket = published_bucket
+    bucket.put_object(Key='articles/1234/elife-1234-v1.xml', Body=b'')
+    check = checks.BucketFileCheck(s3, 'published', 'articles/{id}/elife-{id}-v{version}\\.xml', 'articles/{id}/', polling_profile=QUICK)
+    with mock.patch.object(check, '_list') as listing:
+        assert check.of(id='1234', version=1)
+        listing.assert_not_called()
+
+def test_literal_keys_are_listed_when_head_is_forbidden(published_bucket):
+    s3, bucket = published_bucket
+    bucket.put_object(Key='articles/1234/elife-1234-v1.xml', Body=b'')
+    check = checks.BucketFileCheck(s3, 'published', 'articles/{id}/elife-{id}-v{version}\\.xml', 'articles/{id}/', polling_profile=QUICK)
+    forbidden = botocore_exceptions.ClientError({'Error': {'Code': '403', 'Message': 'Forbidden'}}, 'HeadObject')
+    with mock.patch.object(s3.meta.client, 'head_object', side_effect=forbidden) as head_object:
+        assert check.of(id='1234', version=1)
+        assert check.of(id='1234', version=1)
+        assert head_object.call_count == 1
+
+def test_literal_keys():
+    assert checks._literal_key('articles/1234/elife-1234-v1\\.xml') == 'articles/1234/elife-1234-v1.xml'
+    # . matches any character, and the pattern only has to match the start of a key
+    assert checks._literal_key('articles/1234/elife-1234-v1.xml') is None
+    assert checks._literal_key('outbox/elife-1234\\d\\.xml') is None
+    assert checks._literal_key('outbox/elife-(1234)\\.xml') is None
+
+def test_patterns_are_listed_from_their_literal_prefix(published_bucket):
+    s3, bucket = published_bucket
+    bucket.put_object(Key='pubmed/published/20190101/batch/elife-1234.xml', Body=b'')
+    bucket.put_object(Key='pubmed/published/20240101/batch/elife-5678.xml', Body=b'')
+    check = checks.BucketFileCheck(
+        s3,
+        'published',
+        '{vendor}/published/20[0-9]{{6}}/batch/(elife-.*\\.xml)',
+        '{vendor}/published/',
+        polling_profile=QUICK,
+        start_after='{vendor}/published/{last_modified_after:%Y%m%d}'
+    )
+    assert check.of(vendor='pubmed') == ('elife-1234.xml',)
+
+    # both objects are recent, but their keys are dated in the past
+    last_modified_after = datetime.now(timezone.utc) - timedelta(minutes=1)
+    with mock.patch.object(check, '_list', wraps=check._list) as listing:
+        with pytest.raises(TimeoutError):
+            check.of(vendor='pubmed', last_modified_after=last_modified_after)
+        listing.assert_called_with(
+            'pubmed/published/20',
+            'pubmed/published/%s' % (last_modified_after - timedelta(days=1)).strftime('%Y%m%d'),
+            not_before=last_modified_after
+        )
+
+def test_narrowed_prefix():
+    assert checks._narrowed_prefix('elife-1234-', 'elife-1234-(poa|vor)-v1-20[0-9]{12}.zip') == 'elife-1234-'
+    assert checks._narrowed_prefix(None, 'outbox/elife_poa_e1234.xml') == 'outbox/elife_poa_e1234'
+    assert checks._narrowed_prefix(None, 'outbox/elife-12345?.xml') == 'outbox/elife-1234'
+    assert checks._narrowed_prefix('outbox/', 'outbox/a|inbox/b') == 'outbox/'
+
+def test_checks_share_recent_listings_of_the_same_prefix(published_bucket):
+    s3, bucket = published_bucket
+    bucket.put_object(Key='elife-1234-poa-v1-20240101000000.zip', Body=b'')
+    bucket.put_object(Key='elife-1234-vor-v2-20240102000000.zip', Body=b'')
+    version_1 = checks.BucketFileCheck(s3, 'published', 'elife-{id}-(poa|vor)-v1-20[0-9]{{12}}.zip', 'elife-{id}-', polling_profile=QUICK)
+    version_2 = checks.BucketFileCheck(s3, 'published', 'elife-{id}-(poa|vor)-v2-20[0-9]{{12}}.zip', 'elife-{id}-', polling_profile=QUICK)
+    with mock.patch.object(s3.meta.client, 'get_paginator', wraps=s3.meta.client.get_paginator) as get_paginator:
+        assert version_1.of(id='1234')
+        assert version_2.of(id='1234')
+        assert get_paginator.call_count == 1
+        # a listing started before the object could have been written is not good enough
+        with pytest.raises(TimeoutError):
+            version_2.of(id='1234', last_modified_after=datetime.now() + timedelta(minutes=1))
+        assert get_paginator.call_count > 1
+
+def test_listing_cache_evicts_the_least_recently_used():
+    cache = listings.ListingCache(ttl=60, size=2)
+    now = datetime.now().timestamp()
+    cache.put('a', now, ['a'])
+    cache.put('b', now, ['b'])
+    assert cache.get('a') == ['a']
+    cache.put('c', now, ['c'])
+    assert cache.get('b') is None
+    assert cache.get('a') == ['a']
+    assert cache.get('a', not_before=datetime.now() + timedelta(seconds=1)) is None
+
+class _StubGetter:
+    "stands in for http_client.get, answering with the given (status_code, headers) in turn"
+    def __init__(self, *responses):
+        self._responses = list(responses)
+        self.sent_headers = []
+
+    def __call__(self, url, headers=None, **kwargs):
+        self.sent_headers.append((url, dict(headers or {})))
+        status_code, response_headers = self._responses.pop(0)
+        return mock.Mock(status_code=status_code, headers=response_headers)
+
+def test_conditional_requests_send_the_validators_of_the_last_200():
+    getter = _StubGetter(
+        (200, {'ETag': '"v1"', 'Last-Modified': 'Mon, 15 Jan 2024 10:00:00 GMT'}),
+        (304, {}),
+        (200, {'ETag': '"other"'}),
+    )
+    conditional_requests = checks.ConditionalRequests()
+    assert conditional_requests.get('https://api/articles/1', getter=getter, headers={'Accept': 'application/json'}).status_code == 200
+    assert conditional_requests.get('https://api/articles/1', getter=getter, headers={'Accept': 'application/json'}) is None
+    # validators are per url
+    assert conditional_requests.get('https://api/articles/2', getter=getter).status_code == 200
+    assert getter.sent_headers == [
+        ('https://api/articles/1', {'Accept': 'application/json'}),
+        ('https://api/articles/1', {'Accept': 'application/json', 'If-None-Match': '"v1"', 'If-Modified-Since': 'Mon, 15 Jan 2024 10:00:00 GMT'}),
+        ('https://api/articles/2', {}),
+    ]
+
+def test_conditional_requests_forget_validators_after_an_error():
+    getter = _StubGetter((200, {'ETag': '"v1"'}), (500, {}), (200, {}))
+    conditional_requests = checks.ConditionalRequests()
+    for _ in range(3):
+        conditional_requests.get('https://api/articles/1', getter=getter)
+    assert [headers for (_, headers) in getter.sent_headers] == [{}, {'If-None-Match': '"v1"'}, {}]
+
+def test_not_modified_is_not_a_successful_poll():
+    getter = _StubGetter((200, {'ETag': '"v1"'}), *[(304, {})] * 100)
+    conditional_requests = checks.ConditionalRequests()
+    def _is_ready():
+        response = conditional_requests.get('https://api/articles/1', getter=getter)
+        # the first version is not the one being waited for
+        return response is not None and len(getter.sent_headers) > 1
+    with pytest.raises(TimeoutError):
+        polling.poll(_is_ready, "https://api/articles/1", profile=QUICK)
+    assert len(getter.sent_headers) > 2
+
+def test_concurrent_checks_share_one_get(monkeypatch):
+    requests = []
+    class SlowLaxHandler(BaseHTTPRequestHandler):
+        def do_GET(self): # pylint: disable=invalid-name
+            requests.append(self.path)
+            # long enough for the other check to ask for the same url
+            time.sleep(0.2)
+            body = b'{"version": 1}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args): # pylint: disable=redefined-builtin
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), SlowLaxHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setitem(http_client._SESSION, 'session', None)
+    lax = checks.LaxArticleCheck('http://127.0.0.1:%s' % server.server_port)
+    other_lax = checks.LaxArticleCheck('http://127.0.0.1:%s' % server.server_port)
+    try:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(check.published, id='1234', version=1) for check in (lax, other_lax)]
+            assert [future.result() for future in futures] == [{'version': 1}, {'version': 1}]
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert requests == ['/api/v2/articles/1234/versions/1']
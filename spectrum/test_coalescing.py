@@ -0,0 +1,37 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import pytest
+from . import coalescing
+
+def test_concurrent_calls_for_the_same_key_share_one_execution():
+    single_flight = coalescing.SingleFlight()
+    release = threading.Event()
+    executions = []
+    def _slow_action():
+        executions.append(1)
+        release.wait(5)
+        return 'result'
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [executor.submit(single_flight.call, 'key', _slow_action) for _ in range(3)]
+        _wait_until(lambda: 'key' in single_flight._in_flight and single_flight._in_flight['key'].waiters == 2) # pylint: disable=protected-access
+        release.set()
+        assert [f.result() for f in futures] == ['result', 'result', 'result']
+    assert len(executions) == 1
+    # once completed, nothing is cached
+    assert single_flight.call('key', lambda: 'new result') == 'new result'
+
+def test_errors_are_not_remembered():
+    single_flight = coalescing.SingleFlight()
+    def _failing_action():
+        raise ValueError("failure")
+    with pytest.raises(ValueError):
+        single_flight.call('key', _failing_action)
+    assert single_flight.call('key', lambda: 'result') == 'result'
+
+def _wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "Condition never satisfied"
+        time.sleep(0.001)
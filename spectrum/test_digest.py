@@ -3,11 +3,13 @@ import pytest
 from spectrum import articles
 from spectrum import checks
 from spectrum import input
+from spectrum import polling
 
 DIGEST_ARTICLE_ID = '00790'
 
 @pytest.mark.bot
 @pytest.mark.digests
+@pytest.mark.deadline(polling.CHAINED_TEST_DEADLINE)
 def test_digest_lifecycle(generate_digest, generate_article, modify_article):
     # digest ingestion
     digest = generate_digest(DIGEST_ARTICLE_ID)
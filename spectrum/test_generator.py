@@ -1,5 +1,13 @@
+# pylint: disable=protected-access
+import io
+import os
+import re
+import time
 from unittest import mock
-from . import generator
+import zipfile
+import jinja2
+import pytest
+from . import generator, manifest
 
 def test_generate_article_id():
     cases = [
@@ -12,3 +20,176 @@ def test_generate_article_id():
     for given, expected in cases:
         with mock.patch('spectrum.generator.random.randrange', return_value=9):
             assert generator.generate_article_id(given) == expected
+
+@pytest.fixture(name='tmp')
+def _tmp(tmp_path, monkeypatch):
+    monkeypatch.setitem(generator.COMMON, 'tmp', str(tmp_path))
+    monkeypatch.setitem(generator._TEMPLATE_ENVIRONMENT, 'environment', None)
+    return tmp_path
+
+def _generated_files(tmp):
+    return list(tmp.glob('elife*'))
+
+def _zip_members(article):
+    with article.open() as zip_contents:
+        with zipfile.ZipFile(zip_contents) as zip_file:
+            return {name: zip_file.read(name) for name in zip_file.namelist()}
+
+def test_article_zip_is_not_written_to_disk(tmp):
+    article = generator.article_zip('00625', article_id='12300625')
+    assert not _generated_files(tmp)
+    members = _zip_members(article)
+    assert sorted(members.keys()) == ['elife-12300625-fig1.tif', 'elife-12300625-inf1.tif', 'elife-12300625.pdf', 'elife-12300625.xml']
+    assert b'12300625' in members['elife-12300625.xml']
+    assert sorted(article.figure_names()) == ['fig1', 'inf1']
+    assert article.basename() == 'elife-12300625-vor-r1.zip'
+    assert os.path.exists(article.filename())
+    article.clean()
+    assert not _generated_files(tmp)
+
+def test_replacing_text_in_a_new_revision_keeps_the_original(tmp):
+    article = generator.article_zip('00625', article_id='12300625')
+    new_article = article.new_revision(version=2)
+    new_article.replace_in_text({'12300625': 'REPLACED'})
+    assert new_article.basename() == 'elife-12300625-vor-r2.zip'
+    assert b'REPLACED' in _zip_members(new_article)['elife-12300625.xml']
+    assert b'REPLACED' not in _zip_members(article)['elife-12300625.xml']
+    new_article.clean()
+    article.clean()
+    assert not _generated_files(tmp)
+
+def test_compiled_templates_are_reused(tmp):
+    (filename,) = manifest.template('00625')['jinja']
+    with mock.patch.object(jinja2.Environment, 'compile', wraps=generator._template_environment().compile) as compile_template:
+        generator.article_zip('00625', article_id='12300625').clean()
+        generator.article_zip('00625', article_id='12300626').clean()
+        assert compile_template.call_count == 1
+    assert generator._template_environment().get_template(filename) is generator._template_environment().get_template(filename)
+    # other processes load the bytecode instead of compiling the template again
+    assert list((tmp / 'jinja-bytecode').iterdir())
+
+@pytest.mark.skipif(not os.environ.get('SPECTRUM_BENCHMARK'), reason="benchmarks only run with SPECTRUM_BENCHMARK=1, timings are printed with -s")
+@pytest.mark.usefixtures('tmp')
+def test_template_generation_benchmark():
+    "prints the time taken to generate the templates of each article, with a cold and then a warm template cache"
+    lines = ["%-30s %10s %10s" % ('template', 'cold', 'warm')]
+    totals = {'cold': 0.0, 'warm': 0.0}
+    for template in manifest.templates():
+        timings = {}
+        for cache in ('cold', 'warm'):
+            if cache == 'cold':
+                generator._template_environment().bytecode_cache.clear()
+                generator._TEMPLATE_ENVIRONMENT['environment'] = None
+            with zipfile.ZipFile(io.BytesIO(), 'w') as zip_file:
+                started = time.perf_counter()
+                for filename in template['jinja']:
+                    generator._generate(filename, template['id'], zip_file, template['id'], {})
+                timings[cache] = time.perf_counter() - started
+            totals[cache] += timings[cache]
+        lines.append("%-30s %8.1fms %8.1fms" % (template['name'], timings['cold'] * 1000, timings['warm'] * 1000))
+    lines.append("%-30s %8.1fms %8.1fms" % ('total', totals['cold'] * 1000, totals['warm'] * 1000))
+    print("\n" + "\n".join(lines))
+
+@pytest.mark.usefixtures('tmp')
+def test_large_articles_are_spliced_into_a_regular_file(monkeypatch):
+    monkeypatch.setattr(generator, 'SPOOL_MAX_SIZE', 1024)
+    article = generator.article_zip('00625', article_id='12300625')
+    with article.open() as zip_contents:
+        with zipfile.ZipFile(zip_contents) as zip_file:
+            assert zip_file.testzip() is None
+            assert len(zip_file.namelist()) == 4
+    article.clean()
+
+def test_revisions_share_unmodified_files(tmp):
+    article = generator.article_zip('00625', article_id='12300625')
+    new_version = article.new_version(version=2)
+    new_version.replace_in_text({})
+    assert new_version._contents is article._contents
+
+    new_version.replace_in_text({'12300625': 'REPLACED'})
+    assert b'REPLACED' not in _zip_members(article)['elife-12300625.xml']
+    assert b'12300625' in _zip_members(article)['elife-12300625.xml']
+    assert _zip_members(new_version)['elife-12300625.pdf'] == _zip_members(article)['elife-12300625.pdf']
+    assert not _generated_files(tmp)
+    new_version.clean()
+    article.clean()
+
+@pytest.mark.parametrize('spool_max_size', [generator.SPOOL_MAX_SIZE, 1024])
+@pytest.mark.usefixtures('tmp')
+def test_revisions_sharing_a_zip_read_it_independently(monkeypatch, spool_max_size):
+    monkeypatch.setattr(generator, 'SPOOL_MAX_SIZE', spool_max_size)
+    article = generator.article_zip('00625', article_id='12300625')
+    new_revision = article.new_revision()
+    with article.open() as contents, new_revision.open() as new_contents:
+        assert contents is not new_contents
+        start = contents.read(4)
+        assert new_contents.tell() == 0
+        assert new_contents.read(4) == start == b'PK\x03\x04'
+    new_revision.clean()
+    article.clean()
+
+@pytest.mark.usefixtures('tmp')
+def test_the_zip_on_disk_follows_replacements():
+    article = generator.article_zip('00625', article_id='12300625')
+    new_version = article.new_version(version=2)
+    for each in (article, new_version):
+        with zipfile.ZipFile(each.filename()) as zip_file:
+            assert b'REPLACED' not in zip_file.read('elife-12300625.xml')
+    new_version.replace_in_text({'12300625': 'REPLACED'})
+    with zipfile.ZipFile(new_version.filename()) as zip_file:
+        assert b'REPLACED' in zip_file.read('elife-12300625.xml')
+    with zipfile.ZipFile(article.filename()) as zip_file:
+        assert b'REPLACED' not in zip_file.read('elife-12300625.xml')
+    new_version.clean()
+    article.clean()
+
+@pytest.mark.usefixtures('tmp')
+def test_replacements_are_made_in_a_single_pass():
+    article = generator.article_zip('00625', article_id='12300625')
+    xml = _zip_members(article)['elife-12300625.xml'].decode('utf-8')
+    article.replace_in_text({'<article': '<swapped', '<front': '<article', '<article-meta': '<front-meta'})
+    assert _zip_members(article)['elife-12300625.xml'].decode('utf-8') == (
+        xml.replace('<article-meta', '\0').replace('<article', '\1').replace('<front', '<article').replace('\0', '<front-meta').replace('\1', '<swapped')
+    )
+    article.clean()
+
+def test_article_ejp_zip_only_substitutes_text_files(tmp):
+    source_zip = str(tmp / 'source.zip')
+    with zipfile.ZipFile(source_zip, 'w') as zip_file:
+        zip_file.writestr('manifest.xml', '<doi>10.7554/eLife.36157</doi><doi>10.7554/eLife.361570</doi>', compress_type=zipfile.ZIP_DEFLATED)
+        zip_file.writestr('figure.pdf', b'%PDF eLife.36157')
+    generated = generator.article_ejp_zip(source_zip, '12336157')
+    with zipfile.ZipFile(generated) as zip_file:
+        assert zip_file.read('manifest.xml') == b'<doi>10.7554/eLife.12336157</doi><doi>10.7554/eLife.361570</doi>'
+        assert zip_file.getinfo('manifest.xml').compress_type == zipfile.ZIP_DEFLATED
+        assert zip_file.read('figure.pdf') == b'%PDF eLife.36157'
+
+def test_substitution_matches_across_chunks():
+    text = b'eLife.36157 and eLife.361570, eLife.36157.' * 3
+    expected = text.replace(b'eLife.36157 ', b'eLife.1 ').replace(b'eLife.36157.', b'eLife.1.')
+    pattern = re.compile(br'eLife\.36157\b')
+    for chunk_size in range(1, 30):
+        target = io.BytesIO()
+        generator._substitute_stream(io.BytesIO(text), target, pattern, b'eLife.1', len(b'eLife.36157'), chunk_size=chunk_size)
+        assert target.getvalue() == expected, chunk_size
+
+def test_digest_zip_patches_the_manuscript_number(tmp):
+    docx = pytest.importorskip('docx')
+    with mock.patch('spectrum.generator.random.randrange', return_value=9):
+        digest = generator.digest_zip('99999')
+    assert digest.article_id() == '9099999'
+    with zipfile.ZipFile(digest.filename()) as zip_file:
+        assert sorted(zip_file.namelist()) == ['DIGEST 9099999.docx', 'alligator.jpg']
+        word_document = docx.Document(io.BytesIO(zip_file.read('DIGEST 9099999.docx')))
+    paragraphs = [p for p in word_document.paragraphs if p.runs and p.runs[0].text == 'MANUSCRIPT NUMBER\n']
+    assert [p.runs[1].text for p in paragraphs] == ['9099999']
+    assert os.listdir(str(tmp)) == ['DIGEST 9099999.zip']
+
+def test_digest_manuscript_number_split_across_runs_fails(tmp, monkeypatch):
+    docx = str(tmp / 'DIGEST 99999.docx')
+    with zipfile.ZipFile(docx, 'w') as docx_file:
+        docx_file.writestr(generator.DIGEST_DOCUMENT_XML, '<w:p><w:r><w:t>MANUSCRIPT NUMBER</w:t></w:r><w:r><w:t>999</w:t></w:r><w:r><w:t>99</w:t></w:r></w:p>')
+    monkeypatch.setattr(generator, 'DIGEST_DOCX', docx)
+    monkeypatch.setitem(generator._DIGEST_TEMPLATE, 'template', None)
+    with pytest.raises(AssertionError, match='found 999 and 0 occurrences'):
+        generator._digest_template()
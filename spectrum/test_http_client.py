@@ -0,0 +1,57 @@
+# pylint: disable=protected-access
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import threading
+import time
+import pytest
+from . import http_client
+from .exceptions import UnrecoverableError
+
+def test_circuit_opens_after_consecutive_failures_until_cooldown():
+    health = http_client.HostHealth(threshold=2, cooldown=0.05, retry_budget=10, retry_budget_window=60)
+    health.record_failure('https://lax.example.org/api/v2/articles/1', 'ConnectionError')
+    health.before_request('https://lax.example.org/api/v2/articles/1')
+    health.record_failure('https://lax.example.org/api/v2/articles/1', '503 response')
+    with pytest.raises(UnrecoverableError):
+        health.before_request('https://lax.example.org/api/v2/articles/2')
+    # other hosts are unaffected
+    health.before_request('https://api.example.org/articles/1')
+
+    time.sleep(0.05)
+    health.before_request('https://lax.example.org/api/v2/articles/1')
+    with pytest.raises(UnrecoverableError):
+        health.before_request('https://lax.example.org/api/v2/articles/1')
+    health.record_success('https://lax.example.org/api/v2/articles/1')
+    health.before_request('https://lax.example.org/api/v2/articles/1')
+
+def test_retries_are_limited_per_host():
+    health = http_client.HostHealth(threshold=2, cooldown=60, retry_budget=2, retry_budget_window=60)
+    assert health.allow_retry('https://journal.example.org/a')
+    assert health.allow_retry('https://journal.example.org/b')
+    assert not health.allow_retry('https://journal.example.org/c')
+    assert health.allow_retry('https://iiif.example.org/a')
+
+def test_cookies_are_not_sent_back(monkeypatch):
+    received_cookies = []
+    class CookieSettingHandler(BaseHTTPRequestHandler):
+        def do_GET(self): # pylint: disable=invalid-name
+            received_cookies.append(self.headers.get('Cookie'))
+            self.send_response(200)
+            self.send_header('Set-Cookie', 'session=1234; Path=/')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, format, *args): # pylint: disable=redefined-builtin
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), CookieSettingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setitem(http_client._SESSION, 'session', None)
+    try:
+        url = 'http://127.0.0.1:%s/' % server.server_port
+        assert http_client.get(url).status_code == 200
+        assert http_client.get(url).status_code == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert received_cookies == [None, None]
@@ -0,0 +1,29 @@
+import json
+import subprocess
+import sys
+import pytest
+
+# generous, to guard against regressions like creating clients or loading large modules at import time
+# rather than to measure: importing spectrum.checks takes a few hundred milliseconds
+IMPORT_TIME_LIMIT = 2 # seconds
+
+SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+try:
+    import %s
+except ModuleNotFoundError as e:
+    print(json.dumps({'missing': e.name}))
+    sys.exit(0)
+print(json.dumps({'duration': time.perf_counter() - started, 'loaded': [name for name in ('boto3', 'botocore') if name in sys.modules]}))
+"""
+
+@pytest.mark.parametrize('module', ['spectrum.aws', 'spectrum.checks'])
+def test_importing_is_fast_and_does_not_load_boto3(module):
+    # a new interpreter, as this one has already imported everything
+    output = subprocess.run([sys.executable, '-c', SCRIPT % module], check=True, stdout=subprocess.PIPE).stdout
+    result = json.loads(output.decode().splitlines()[-1])
+    if 'missing' in result:
+        pytest.skip("%s cannot be imported without %s" % (module, result['missing']))
+    assert result['loaded'] == [], "boto3 and botocore should only be loaded when a client is first used"
+    assert result['duration'] < IMPORT_TIME_LIMIT
@@ -0,0 +1,62 @@
+# pylint: disable=protected-access
+import json
+import os
+import pytest
+from . import manifest
+
+@pytest.fixture(name='templates_directory')
+def _templates_directory(tmp_path, monkeypatch):
+    monkeypatch.setitem(manifest.COMMON, 'tmp', str(tmp_path / 'tmp'))
+    monkeypatch.setitem(manifest._MANIFEST, 'manifest', None)
+    templates_directory = tmp_path / 'templates'
+    template = templates_directory / 'elife-00625-vor-r1'
+    template.mkdir(parents=True)
+    (templates_directory / 'digests').mkdir()
+    (templates_directory / 'elife-xpub').mkdir()
+    (template / 'elife-00625-fig1.tif').write_bytes(b'12345')
+    (template / 'elife-00625.xml.jinja').write_bytes(b'123')
+    monkeypatch.setattr(manifest, 'TEMPLATES_DIRECTORY', str(templates_directory))
+    return templates_directory
+
+def test_templates_are_described(templates_directory):
+    template = manifest.template('00625')
+    assert template == {
+        'name': 'elife-00625-vor-r1',
+        'path': '%s/elife-00625-vor-r1' % templates_directory,
+        'id': '00625',
+        'kind': 'vor',
+        'figure_names': ['fig1'],
+        'has_pdf': False,
+        'files': ['%s/elife-00625-vor-r1/elife-00625-fig1.tif' % templates_directory],
+        'jinja': ['%s/elife-00625-vor-r1/elife-00625.xml.jinja' % templates_directory],
+        'bytes': 8,
+    }
+    with open(os.path.join(manifest.COMMON['tmp'], 'template-manifest.json')) as manifest_file:
+        assert json.load(manifest_file)['templates'] == [template]
+
+def test_manifest_is_rebuilt_when_templates_change(templates_directory):
+    assert not manifest.template('00625')['has_pdf']
+    pdf = templates_directory / 'elife-00625-vor-r1' / 'elife-00625.pdf'
+    pdf.write_bytes(b'')
+    # directory modification times may not be fine grained enough to notice
+    os.utime(str(pdf.parent), ns=(0, 0))
+    assert manifest.template('00625')['has_pdf']
+
+    # edited in place: neither directory changes
+    jinja = templates_directory / 'elife-00625-vor-r1' / 'elife-00625.xml.jinja'
+    directory_times = [os.stat(str(directory)).st_mtime_ns for directory in (templates_directory, jinja.parent)]
+    jinja.write_bytes(b'12345')
+    os.utime(str(templates_directory), ns=(directory_times[0], directory_times[0]))
+    os.utime(str(jinja.parent), ns=(directory_times[1], directory_times[1]))
+    assert manifest.template('00625')['bytes'] == 10
+
+    (templates_directory / 'elife-04637-poa-r1').mkdir()
+    os.utime(str(templates_directory), ns=(0, 0))
+    assert [template['id'] for template in manifest.templates()] == ['00625', '04637']
+
+@pytest.mark.usefixtures('templates_directory')
+def test_manifest_is_loaded_from_disk_by_other_processes(monkeypatch):
+    manifest.templates()
+    monkeypatch.setitem(manifest._MANIFEST, 'manifest', None)
+    monkeypatch.setattr(manifest, '_build', lambda: pytest.fail("manifest built again"))
+    assert manifest.template('00625')['kind'] == 'vor'
@@ -0,0 +1,77 @@
+# pylint: disable=protected-access
+from datetime import datetime, timedelta
+import json
+import re
+from unittest import mock
+import pytest
+from . import checks, notifications
+
+moto = pytest.importorskip('moto')
+boto3 = pytest.importorskip('boto3')
+
+pytestmark = pytest.mark.usefixtures('polls_filename')
+
+@pytest.fixture(name='bucket_with_notifications')
+def _bucket_with_notifications(tmp_path):
+    with moto.mock_aws():
+        s3 = boto3.resource('s3', region_name='us-east-1')
+        sqs = boto3.client('sqs', region_name='us-east-1')
+        queue_url = sqs.create_queue(QueueName='spectrum-notifications')['QueueUrl']
+        queue_arn = sqs.get_queue_attributes(QueueUrl=queue_url, AttributeNames=['QueueArn'])['Attributes']['QueueArn']
+        bucket = s3.create_bucket(Bucket='published')
+        s3.meta.client.put_bucket_notification_configuration(
+            Bucket='published',
+            NotificationConfiguration={'QueueConfigurations': [{'QueueArn': queue_arn, 'Events': ['s3:ObjectCreated:*']}]}
+        )
+        bucket_notifications = notifications.BucketNotifications(sqs, 'spectrum-notifications', min_interval=0, filename=str(tmp_path / 'notifications.sqlite3'))
+        yield bucket, bucket_notifications
+        bucket_notifications.close()
+
+def test_finds_announced_objects(bucket_with_notifications):
+    bucket, bucket_notifications = bucket_with_notifications
+    before = datetime.now() - timedelta(minutes=1)
+    bucket.put_object(Key='articles/1234/elife-1234-v1.xml', Body=b'<article/>')
+
+    found = bucket_notifications.find('published', re.compile(r'articles/1234/elife-1234-v1\.xml'), last_modified_after=before)
+    assert found is not None
+    assert found[0] == 'articles/1234/elife-1234-v1.xml'
+    assert bucket_notifications.find('other-bucket', re.compile(r'articles/1234/.*')) is None
+    assert bucket_notifications.find('published', re.compile(r'articles/1234/.*'), last_modified_after=datetime.now() + timedelta(minutes=1)) is None
+
+def test_announcements_are_shared_and_removed_from_the_queue(bucket_with_notifications, tmp_path):
+    bucket, bucket_notifications = bucket_with_notifications
+    bucket.put_object(Key='articles/1234/elife-1234-v1.xml', Body=b'<article/>')
+    assert bucket_notifications.find('published', re.compile(r'articles/1234/elife-1234-v1\.xml'))
+
+    sqs = bucket_notifications._sqs
+    queue_url = sqs.get_queue_url(QueueName='spectrum-notifications')['QueueUrl']
+    assert not sqs.receive_message(QueueUrl=queue_url, WaitTimeSeconds=0).get('Messages')
+    # e.g. in another xdist worker
+    other_notifications = notifications.BucketNotifications(sqs, 'spectrum-notifications', min_interval=0, filename=str(tmp_path / 'notifications.sqlite3'))
+    assert other_notifications.find('published', re.compile(r'articles/1234/elife-1234-v1\.xml'))
+    other_notifications.close()
+
+def test_bucket_file_check_does_not_list_announced_objects(bucket_with_notifications):
+    bucket, bucket_notifications = bucket_with_notifications
+    bucket.put_object(Key='articles/1234/elife-1234-v1.xml', Body=b'<article/>')
+
+    s3 = mock.Mock()
+    check = checks.BucketFileCheck(s3, 'published', 'articles/{id}/elife-{id}-v{version}.xml', notifications=bucket_notifications)
+    assert check.of(id='1234', version=1)
+    s3.Bucket.assert_not_called()
+    assert not s3.meta.client.method_calls
+
+def test_object_created_events_wrapped_in_sns():
+    record = {
+        'eventName': 'ObjectCreated:Put',
+        'eventTime': '2024-01-15T10:00:00.000Z',
+        's3': {'bucket': {'name': 'published'}, 'object': {'key': 'digests/1234/digest+1234.jpg'}},
+    }
+    body = json.dumps({'Type': 'Notification', 'Message': json.dumps({'Records': [record]})})
+    events = notifications.object_created_events(body)
+    assert len(events) == 1
+    bucket, key, event_time = events[0]
+    assert bucket == 'published'
+    assert key == 'digests/1234/digest 1234.jpg'
+    assert event_time.isoformat() == '2024-01-15T10:00:00+00:00'
+    assert not notifications.object_created_events('{"Event": "s3:TestEvent"}')
@@ -0,0 +1,70 @@
+from unittest import mock
+import pytest
+from . import polling, telemetry
+from .exceptions import TimeoutError
+
+pytestmark = pytest.mark.usefixtures('polls_filename')
+
+def test_profile_steps_grow_up_to_a_jittered_cap():
+    profile = polling.PollingProfile('test', initial=1, factor=2, cap=5, jitter=0.2)
+    steps = [profile.initial]
+    for _ in range(5):
+        steps.append(profile.next_step(steps[-1]))
+    assert steps[0:3] == [1, 2, 4]
+    for step in steps[3:]:
+        assert 4 <= step <= 5
+
+def test_poll_returns_first_truthy_result():
+    profile = polling.PollingProfile('test', initial=0.01, factor=1, cap=0.01, timeout=1)
+    results = iter([False, (False, 'detail'), 'found'])
+    assert polling.poll(lambda: next(results), "something", profile=profile) == 'found'
+
+def test_poll_gives_up_after_the_profile_timeout():
+    profile = polling.PollingProfile('test', initial=0.01, factor=1, cap=0.01, timeout=0.05)
+    with mock.patch('spectrum.polling.debug.get_host_ip'):
+        with pytest.raises(TimeoutError) as exc_info:
+            polling.poll(lambda: (False, 'last detail'), "something %s", 'specific', profile=profile)
+    assert 'something specific' in str(exc_info.value)
+    assert 'last detail' in str(exc_info.value)
+
+def test_poll_is_recorded(polls_filename):
+    class SomeCheck:
+        def of(self, target):
+            profile = polling.PollingProfile('test', initial=0.01, factor=1, cap=0.01, timeout=1)
+            results = iter([(False, {'status': 'pending'}), True])
+            return polling.poll(lambda: next(results), "something %s", target, profile=profile)
+    SomeCheck().of('specific')
+
+    records = telemetry.read_polls(polls_filename)
+    assert len(records) == 1
+    record = records[0]
+    assert record['check'] == 'test_poll_is_recorded.<locals>.SomeCheck.of'
+    assert record['target'] == 'something specific'
+    assert record['attempts'] == 2
+    assert record['outcome'] == 'success'
+    assert record['last_seen_size'] > 0
+    assert telemetry.summary_lines([record])[0] == "1 polls recorded in %s" % polls_filename
+
+def test_error_messages_are_only_built_when_a_poll_fails(polls_filename):
+    profile = polling.PollingProfile('test', initial=0.01, factor=1, cap=0.01, timeout=1)
+    error_message = mock.Mock(side_effect=RuntimeError("expensive, or broken"))
+    assert polling.poll(lambda: True, error_message, '1234', profile=profile)
+    error_message.assert_not_called()
+    assert telemetry.read_polls(polls_filename)[0]['target'] == '1234'
+
+def test_poll_is_limited_by_the_deadline():
+    profile = polling.PollingProfile('test', initial=0.01, factor=1, cap=0.01, timeout=60)
+    with polling.deadline(0.05):
+        with pytest.raises(TimeoutError) as exc_info:
+            polling.poll(lambda: False, "something", profile=profile)
+        assert 'shortened by the deadline' in str(exc_info.value)
+        with pytest.raises(TimeoutError) as exc_info:
+            polling.poll(lambda: True, "something else", profile=profile)
+        assert 'already passed' in str(exc_info.value)
+    # back to the enclosing budget, if any
+    assert polling.remaining_budget() is None or polling.remaining_budget() > 1
+
+def test_nested_deadlines_cannot_extend_the_budget():
+    with polling.deadline(10):
+        with polling.deadline(1000):
+            assert polling.remaining_budget() <= 10
@@ -0,0 +1,28 @@
+from unittest import mock
+import pytest
+from . import generator, prefetch
+
+@pytest.fixture(autouse=True)
+def _tmp(tmp_path, monkeypatch):
+    monkeypatch.setitem(generator.COMMON, 'tmp', str(tmp_path))
+    monkeypatch.setitem(generator._TEMPLATE_ENVIRONMENT, 'environment', None) # pylint: disable=protected-access
+
+def test_prefetched_articles_are_taken_once():
+    prefetcher = prefetch.ArticlePrefetcher(workers=2)
+    prefetcher.prefetch(['00625', '00625', '00230'])
+    first = prefetcher.take('00625')
+    second = prefetcher.take('00625')
+    assert first.id() != second.id()
+    assert prefetcher.take('00625') is None
+    for article in [first, second]:
+        article.clean()
+    prefetcher.close()
+
+def test_leftover_articles_are_cleaned():
+    prefetcher = prefetch.ArticlePrefetcher(workers=1)
+    article = mock.Mock()
+    with mock.patch.object(generator, 'article_zip', return_value=article):
+        prefetcher.prefetch(['00625'])
+        prefetcher.prefetch(['00625'])
+        prefetcher.close()
+    article.clean.assert_called_once_with()
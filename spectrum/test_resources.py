@@ -0,0 +1,75 @@
+# pylint: disable=protected-access
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+import pytest
+from . import resources
+
+@pytest.fixture(name='cache')
+def _cache(tmp_path):
+    cache = resources.ResourceCache(str(tmp_path / 'resources.sqlite3'), ttl=60, immutable_ttl=3600, size=3)
+    yield cache
+    cache.close()
+
+def test_resources_are_cached_for_each_method(cache):
+    cache.put_many('head', {'https://example.com/a.css': 200})
+    assert cache.get_many('head', ['https://example.com/a.css', 'https://example.com/b.css']) == {'https://example.com/a.css': 200}
+    assert cache.get_many('get', ['https://example.com/a.css']) == {}
+
+def test_fingerprinted_resources_are_cached_for_longer(cache):
+    now = 1000000
+    with mock.patch('spectrum.resources.time.time', return_value=now):
+        cache.put_many('head', {
+            'https://example.com/assets/all.5f3a9b2c.css': 200,
+            'https://example.com/iiif/2/elife-1234-fig1/full/500,/0/default.jpg': 200,
+        })
+    with mock.patch('spectrum.resources.time.time', return_value=now + 120):
+        assert cache.get_many('head', ['https://example.com/assets/all.5f3a9b2c.css', 'https://example.com/iiif/2/elife-1234-fig1/full/500,/0/default.jpg']) == {
+            'https://example.com/assets/all.5f3a9b2c.css': 200,
+        }
+
+def test_article_ids_are_not_fingerprints():
+    assert resources.FINGERPRINT.search('/assets/patterns/css/all.5f3a9b2c.css')
+    assert resources.FINGERPRINT.search('/assets/5f3a9b2c0d1e/app.js')
+    assert not resources.FINGERPRINT.search('/iiif/2/elife-12300625-fig1/full/500,/0/default.jpg')
+    assert not resources.FINGERPRINT.search('/articles/1234567890/figures')
+
+def test_connections_are_closed(cache):
+    cache.put_many('head', {'https://example.com/a': 200})
+    connection = cache._connection()
+    cache.close()
+    with pytest.raises(resources.sqlite3.ProgrammingError):
+        connection.execute("SELECT 1")
+    assert cache.get_many('head', ['https://example.com/a']) == {'https://example.com/a': 200}
+
+def test_least_recently_used_resources_are_evicted(tmp_path):
+    cache = resources.ResourceCache(str(tmp_path / 'resources.sqlite3'), ttl=3600, immutable_ttl=3600, size=3)
+    now = 1000000
+    for offset, url in enumerate(['https://example.com/a', 'https://example.com/b', 'https://example.com/c']):
+        with mock.patch('spectrum.resources.time.time', return_value=now + offset * 10):
+            cache.put_many('head', {url: 200})
+    with mock.patch('spectrum.resources.time.time', return_value=now + 100):
+        # touched more than LAST_USED_RESOLUTION seconds after being cached
+        assert cache.get_many('head', ['https://example.com/a']) == {'https://example.com/a': 200}
+        cache.put_many('head', {'https://example.com/d': 200})
+        assert sorted(cache.get_many('head', ['https://example.com/a', 'https://example.com/b', 'https://example.com/c', 'https://example.com/d'])) == [
+            'https://example.com/a', 'https://example.com/c', 'https://example.com/d'
+        ]
+
+def test_a_broken_database_is_a_miss(tmp_path):
+    (tmp_path / 'resources.sqlite3').write_bytes(b'not a database' * 100)
+    cache = resources.ResourceCache(str(tmp_path / 'resources.sqlite3'), ttl=60, immutable_ttl=3600, size=3)
+    cache.put_many('head', {'https://example.com/a': 200})
+    assert cache.get_many('head', ['https://example.com/a']) == {}
+
+def _put_from_another_process(filename, index):
+    cache = resources.ResourceCache(filename, ttl=60, immutable_ttl=3600, size=1000)
+    for number in range(20):
+        cache.put_many('head', {'https://example.com/%s/%s' % (index, number): 200})
+    return len(cache.get_many('head', ['https://example.com/%s/%s' % (index, number) for number in range(20)]))
+
+def test_resources_are_shared_between_processes(tmp_path):
+    filename = str(tmp_path / 'resources.sqlite3')
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        assert list(executor.map(_put_from_another_process, [filename] * 4, range(4))) == [20] * 4
+    cache = resources.ResourceCache(filename, ttl=60, immutable_ttl=3600, size=1000)
+    assert len(cache.get_many('head', ['https://example.com/%s/%s' % (index, number) for index in range(4) for number in range(20)])) == 80
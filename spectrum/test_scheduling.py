@@ -0,0 +1,92 @@
+# pylint: disable=protected-access
+from unittest import mock
+import pytest
+from . import manifest
+
+scheduling = pytest.importorskip('spectrum.scheduling')
+
+JUNIT = """<?xml version="1.0" encoding="utf-8"?>
+<testsuites><testsuite name="pytest" tests="3">
+<testcase classname="spectrum.test_article" name="test_article_first_version[00625]" time="100.0"/>
+<testcase classname="spectrum.test_article" name="test_article_first_version[04637]" time="300.0"/>
+<testcase classname="spectrum.test_generator" name="test_generate_article_id" time="0.5"/>
+</testsuite></testsuites>
+"""
+
+@pytest.fixture(autouse=True)
+def _templates(monkeypatch):
+    monkeypatch.setattr(manifest, 'templates', lambda: [
+        {'id': '00625', 'bytes': 0},
+        {'id': '04637', 'bytes': 0},
+        {'id': '1234567890', 'bytes': 30 * 1024 * 1024},
+    ])
+
+def test_junit_key():
+    assert scheduling._junit_key('spectrum/test_article.py::test_article_first_version[15893]') == ('spectrum.test_article', 'test_article_first_version[15893]')
+    assert scheduling._junit_key('spectrum/test_x.py::TestY::test_z') == ('spectrum.test_x.TestY', 'test_z')
+
+def test_durations_come_from_the_previous_run_or_template_sizes(tmp_path):
+    junit = tmp_path / 'junit.xml'
+    junit.write_text(JUNIT)
+    nodeids = [
+        'spectrum/test_generator.py::test_generate_article_id',
+        'spectrum/test_article.py::test_article_first_version[00625]',
+        'spectrum/test_article.py::test_article_first_version[1234567890]',
+        'spectrum/test_generator.py::test_never_run_before',
+    ]
+    estimates = scheduling.estimated_durations(nodeids, scheduling.previous_durations(str(junit)))
+    # the templates of the previous run took 200/60 times their estimate
+    kitchen_sink = (scheduling.TEMPLATE_SECONDS + 30 * scheduling.TEMPLATE_SECONDS_PER_MEGABYTE) * 200 / 60
+    assert estimates == [0.5, 100.0, pytest.approx(kitchen_sink), 100.0]
+
+def test_durations_without_a_previous_run(tmp_path):
+    durations = scheduling.previous_durations(str(tmp_path / 'missing.xml'))
+    assert durations == {}
+    estimates = scheduling.estimated_durations(['spectrum/test_article.py::test_article_first_version[1234567890]', 'spectrum/test_a.py::test_b'], durations)
+    assert estimates == [scheduling.TEMPLATE_SECONDS + 30 * scheduling.TEMPLATE_SECONDS_PER_MEGABYTE, 0]
+
+class _Node:
+    def __init__(self, name):
+        self.name = name
+        self.gateway = mock.Mock(id=name)
+        self.shutting_down = False
+        self.sent = []
+
+    def send_runtest_some(self, indices):
+        self.sent.extend(indices)
+
+    def shutdown(self):
+        self.shutting_down = True
+
+def _config(workers):
+    "the options of `pytest --numprocesses workers` read by LoadScheduling"
+    return mock.Mock(getvalue=lambda name: ['%d*popen' % workers] if name == 'tx' else None, getoption=lambda name: None)
+
+def test_xdist_internals_are_still_there():
+    "if this fails after upgrading pytest-xdist, LongestFirstScheduling has to be adapted to the new version"
+    scheduler = scheduling.LongestFirstScheduling(_config(2))
+    missing = [name for name in scheduling.XDIST_INTERNALS if not hasattr(scheduler, name)]
+    assert missing == [], "pytest-xdist no longer has %s" % missing
+
+def test_longest_tests_are_sent_first_to_the_first_free_worker(tmp_path):
+    scheduler = scheduling.LongestFirstScheduling(_config(2), junit_filename=str(tmp_path / 'missing.xml'))
+    nodes = [_Node('gw0'), _Node('gw1')]
+    collection = [
+        'spectrum/test_a.py::test_quick',
+        'spectrum/test_article.py::test_article_first_version[1234567890]',
+        'spectrum/test_article.py::test_article_first_version[00625]',
+        'spectrum/test_b.py::test_quick',
+        'spectrum/test_c.py::test_quick',
+    ]
+    for node in nodes:
+        scheduler.add_node(node)
+        scheduler.add_node_collection(node, collection)
+    scheduler.schedule()
+    assert nodes[0].sent == [1, 0]
+    assert nodes[1].sent == [2, 3]
+    assert scheduler.pending == [4]
+
+    scheduler.mark_test_complete(nodes[1], 2)
+    assert nodes[1].sent == [2, 3, 4]
+    scheduler.mark_test_complete(nodes[0], 1)
+    assert nodes[0].shutting_down
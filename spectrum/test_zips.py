@@ -0,0 +1,26 @@
+import io
+import zipfile
+import pytest
+from . import zips
+
+@pytest.mark.parametrize('destination_kind', ['memory', 'file'])
+def test_copy_member_renames_without_recompressing(tmp_path, destination_kind):
+    source_filename = str(tmp_path / 'source.zip')
+    with zipfile.ZipFile(source_filename, 'w') as source:
+        source.writestr('elife-00625-fig1.tif', b'image' * 1000, compress_type=zipfile.ZIP_DEFLATED)
+        source.writestr('elife-00625.pdf', b'pdf' * 1000)
+    # a regular file is opened by zipfile itself, and copied to with os.copy_file_range
+    destination_file = io.BytesIO() if destination_kind == 'memory' else str(tmp_path / 'destination.zip')
+
+    with zipfile.ZipFile(source_filename) as source:
+        with zipfile.ZipFile(destination_file, 'w') as destination:
+            for info in source.infolist():
+                zips.copy_member(source, info, destination, info.filename.replace('00625', '12300625'))
+            destination.writestr('elife-12300625.xml', '<article/>')
+
+    with zipfile.ZipFile(destination_file) as destination:
+        assert destination.testzip() is None
+        assert destination.namelist() == ['elife-12300625-fig1.tif', 'elife-12300625.pdf', 'elife-12300625.xml']
+        assert destination.getinfo('elife-12300625-fig1.tif').compress_type == zipfile.ZIP_DEFLATED
+        assert destination.read('elife-12300625-fig1.tif') == b'image' * 1000
+        assert destination.read('elife-12300625.pdf') == b'pdf' * 1000
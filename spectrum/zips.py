@@ -0,0 +1,82 @@
+"""utility library for copying members from a zip file to another without decompressing them,
+possibly under a different name.
+
+contains no tests to be run."""
+
+import errno
+import io
+import os
+import struct
+import zipfile
+
+# positions in zipfile.structFileHeader
+_FH_FILENAME_LENGTH = 10
+_FH_EXTRA_FIELD_LENGTH = 11
+# general purpose flag: CRC and sizes are in a data descriptor following the data rather than in the header
+_FLAG_DATA_DESCRIPTOR = 0x08
+CHUNK_SIZE = 1024 * 1024
+
+def copy_member(source, info, destination, name=None):
+    """Appends the member `info` of source, a zipfile.ZipFile open for reading,
+    to destination, a zipfile.ZipFile open for writing, renamed to `name` if given.
+
+    The compressed data is copied as it is, with os.copy_file_range where both zips are regular files:
+    only the local header and the central directory entry are written anew."""
+    new_info = zipfile.ZipInfo(name if name else info.filename, info.date_time)
+    new_info.compress_type = info.compress_type
+    new_info.CRC = info.CRC
+    new_info.compress_size = info.compress_size
+    new_info.file_size = info.file_size
+    new_info.external_attr = info.external_attr
+    new_info.create_system = info.create_system
+    new_info.flag_bits = info.flag_bits & ~_FLAG_DATA_DESCRIPTOR
+    new_info.header_offset = destination.fp.tell()
+    destination.fp.write(new_info.FileHeader())
+    _copy_range(source.fp, _data_offset(source.fp, info), info.compress_size, destination.fp)
+    destination.start_dir = destination.fp.tell()
+    destination.filelist.append(new_info)
+    destination.NameToInfo[new_info.filename] = new_info
+    # otherwise the central directory isn't written on close
+    destination._didModify = True # pylint: disable=protected-access
+    return new_info
+
+def _data_offset(source_fp, info):
+    "the local header may have a different extra field than the central directory entry, so it has to be read"
+    source_fp.seek(info.header_offset)
+    header = struct.unpack(zipfile.structFileHeader, source_fp.read(zipfile.sizeFileHeader))
+    return info.header_offset + zipfile.sizeFileHeader + header[_FH_FILENAME_LENGTH] + header[_FH_EXTRA_FIELD_LENGTH]
+
+def _copy_range(source_fp, offset, length, destination_fp):
+    "copies length bytes starting at offset of source_fp to the current position of destination_fp"
+    source_fileno = _fileno(source_fp)
+    destination_fileno = _fileno(destination_fp)
+    if source_fileno is not None and destination_fileno is not None and hasattr(os, 'copy_file_range'):
+        destination_fp.flush()
+        destination_offset = destination_fp.tell()
+        copied = 0
+        try:
+            while copied < length:
+                copied_now = os.copy_file_range(source_fileno, destination_fileno, length - copied, offset + copied, destination_offset + copied)
+                if copied_now == 0:
+                    break
+                copied = copied + copied_now
+        except OSError as e:
+            # e.g. not supported by the kernel or across these file systems
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+        destination_fp.seek(destination_offset + copied)
+        offset = offset + copied
+        length = length - copied
+    source_fp.seek(offset)
+    while length > 0:
+        chunk = source_fp.read(min(CHUNK_SIZE, length))
+        if not chunk:
+            raise zipfile.BadZipFile("Unexpected end of data, %d bytes missing" % length)
+        destination_fp.write(chunk)
+        length = length - len(chunk)
+
+def _fileno(fileobj):
+    "the file descriptor of regular files, None for in-memory or spooled ones"
+    if not isinstance(fileobj, (io.FileIO, io.BufferedReader, io.BufferedWriter, io.BufferedRandom)):
+        return None
+    return fileobj.fileno()